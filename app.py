@@ -1,29 +1,16 @@
 import streamlit as st
-import google.generativeai as genai
-from docx import Document
-from docx.shared import Pt, RGBColor
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.oxml.ns import qn
-from docx.oxml import OxmlElement
-from prompts import get_medical_prompt
-from PIL import Image
-import io
-import os
+from transcription_cache import get_cache
+from gemini_pipeline import is_quota_error
+from gemini_scheduler import parse_api_keys, set_api_keys
+from converter import run_conversion
+from jobs import submit_job, resubmit_job, get_job, ensure_workers
+from word_export import create_styled_word_doc
+from metrics import collect
+from sections import split_sections, section_title, paginate
+from dedup import DEDUP_MODE
+from common import env_int
 import requests
-import random
 import time
-import tempfile
-
-# OCR
-try:
-    import pytesseract
-except ImportError:
-    pytesseract = None
-
-try:
-    from pdf2image import convert_from_bytes
-except ImportError:
-    convert_from_bytes = None
 
 # ---------------------------------------------------------
 # إعداد الصفحة
@@ -57,23 +44,6 @@ div[class*="viewerBadge"] {display: none !important;}
 </style>
 """, unsafe_allow_html=True)
 
-# ---------------------------------------------------------
-# أذكار
-# ---------------------------------------------------------
-AZKAR_LIST = [
-    "سبحان الله وبحمده، سبحان الله العظيم 🌿",
-    "اللهم صل وسلم وبارك على نبينا محمد ﷺ",
-    "لا حول ولا قوة إلا بالله العلي العظيم",
-    "أستغفر الله العظيم وأتوب إليه",
-    "سبحان الله، والحمد لله، ولا إله إلا الله، والله أكبر",
-    "اللهم إنك عفو كريم تحب العفو فاعف عنا",
-    "يا حي يا قيوم برحمتك أستغيث",
-    "ربّ اشرح لي صدري ويسّر لي أمري"
-]
-
-def zikr_update(box, prefix="⏳ جاري المعالجة"):
-    box.markdown(f"**{prefix}.. {random.choice(AZKAR_LIST)}** 📿")
-
 # ---------------------------------------------------------
 # مفاتيح وأمان
 # ---------------------------------------------------------
@@ -84,180 +54,154 @@ except:
     GOOGLE_SHEET_URL = ""
     api_key = None
 
-# ---------------------------------------------------------
-# أدوات مساعدة
-# ---------------------------------------------------------
-def convert_images_to_pdf(image_files):
-    images = []
-    for file in image_files:
-        img = Image.open(file)
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        images.append(img)
-    if not images:
-        return None
-    pdf_io = io.BytesIO()
-    images[0].save(pdf_io, format='PDF', save_all=True, append_images=images[1:])
-    pdf_io.seek(0)
-    return pdf_io
+# مفاتيح Gemini إضافية (list أو مفصولة بفواصل): لما رصيد مفتاح يخلص بنكمل باللي بعده
+try:
+    extra_keys = parse_api_keys(st.secrets["GEMINI_API_KEYS"])
+except:
+    extra_keys = []
+api_keys = parse_api_keys([api_key] if api_key else []) + extra_keys
 
-# ---------------------------------------------------------
-# OCR
-# ---------------------------------------------------------
-def ocr_image(image):
-    if pytesseract is None:
-        raise RuntimeError("pytesseract غير مثبت.")
-    return pytesseract.image_to_string(image, lang='ara+eng', config='--psm 3')
-
-def process_with_standard_ocr(files, status_box):
-    result_text = ""
-
-    for i, f in enumerate(files):
-        zikr_update(status_box, "📄 جاري استخراج النص (OCR)")
-        time.sleep(0.8)
-
-        if f.type == "application/pdf":
-            if convert_from_bytes is None:
-                result_text += "\n⚠️ pdf2image غير مثبت لمعالجة PDF.\n"
-                continue
-            pages = convert_from_bytes(f.getvalue())
-            for idx, page in enumerate(pages):
-                zikr_update(status_box, f"📄 OCR صفحة {idx+1}")
-                text = ocr_image(page)
-                result_text += f"\n\n--- صفحة {idx+1} من {f.name} ---\n{text}"
-        else:
-            img = Image.open(f)
-            text = ocr_image(img)
-            result_text += f"\n\n--- محتوى الصورة: {f.name} ---\n{text}"
+# أقصى عدد صفحات OCR بالتوازي لكل جلسة (عشان كذا طالب على نفس السيرفر)
+try:
+    OCR_MAX_WORKERS = int(st.secrets["OCR_MAX_WORKERS"])
+except:
+    OCR_MAX_WORKERS = None
 
-    return result_text
+# عدد عمليات التحويل في الخلفية (0 = التحويل يحصل جوه الصفحة نفسها زي زمان)
+try:
+    JOB_WORKERS = int(st.secrets["JOB_WORKERS"])
+except:
+    JOB_WORKERS = env_int("MEDMATE_JOB_WORKERS", 2, minimum=0)
+
+def cache_caption(hits, kind):
+    counters = get_cache().stats().get(kind, {})
+    st.caption(f"⚡ {hits} ملف رجع من الكاش في المرة دي "
+               f"(الإجمالي: {counters.get('hits', 0)} hit / {counters.get('misses', 0)} miss)")
+
+def timing_table(rows):
+    # الوقت الكلي للمراحل اللي بتشتغل بالتوازي (صفحات OCR وأجزاء Gemini) ممكن يعدي الوقت الفعلي
+    st.table([{
+        "المرحلة": row["stage"],
+        "عدد المرات": row["count"],
+        "الوقت الكلي (ث)": f"{row['seconds']:.2f}",
+        "أطول مرة (ث)": f"{row['max_seconds']:.2f}",
+        "صفحات": row["pages"],
+        "الحجم (MB)": f"{row['bytes'] / 2 ** 20:.1f}",
+    } for row in rows])
+
+# المعاينة بتعرض آخر جزء من النص بس، عشان رسم markdown طويل كل ثانية ما يبطّأش الصفحة
+PREVIEW_CHARS = 3000
+
+def preview_tail(text):
+    if len(text) <= PREVIEW_CHARS:
+        return text
+    tail = text[-PREVIEW_CHARS:]
+    # من أول سطر كامل عشان السطر المقطوع ما يبوظش الـ markdown
+    return "…\n\n" + tail[tail.find("\n") + 1:]
 
 # ---------------------------------------------------------
-# Word Formatting
+# النص مقسم أقسام: صفحة واحدة بس هي اللي بتترسم، وكل قسم ليه خانة تعديل لوحده
+# فالتعديل بيبعت القسم اللي اتغير بس مش النص كله
 # ---------------------------------------------------------
-def add_markdown_paragraph(parent, text, style='Normal', align=None):
-    if hasattr(parent, 'add_paragraph'):
-        p = parent.add_paragraph(style=style)
-    else:
-        p = parent
+def current_sections():
+    text = st.session_state['converted_text']
+    if st.session_state.get('sections_text') != text:
+        # تحويل جديد: أقسام جديدة ومفاتيح خانات جديدة، والخانات القديمة بتتمسح من الذاكرة
+        for key in [key for key in st.session_state if str(key).startswith("section_")]:
+            del st.session_state[key]
+        st.session_state['sections'] = split_sections(text)
+        st.session_state['sections_text'] = text
+        st.session_state['sections_version'] = st.session_state.get('sections_version', 0) + 1
+        st.session_state['review_page'] = 1
+    return st.session_state['sections']
+
+def save_section(idx, key):
+    sections = st.session_state['sections']
+    text = st.session_state[key]
+    # القسم اللي بعده لازم يفضل يبدأ في سطر جديد
+    if idx < len(sections) - 1 and not text.endswith('\n'):
+        text += '\n'
+    sections[idx] = text
+    st.session_state['converted_text'] = "".join(sections)
+    st.session_state['sections_text'] = st.session_state['converted_text']
+
+def show_review():
+    sections = current_sections()
+    pages = paginate(sections)
+    page = 1
+    if len(pages) > 1:
+        page = st.number_input(f"الصفحة (من {len(pages)}):", min_value=1, max_value=len(pages),
+                               key="review_page")
+    first, last = pages[page - 1]
+    version = st.session_state['sections_version']
 
-    text = text.replace('***', '**')  # نسيب bold فقط
-    if align:
-        p.alignment = align
-    else:
-        p.alignment = WD_ALIGN_PARAGRAPH.RIGHT if any("\u0600" <= c <= "\u06FF" for c in text) else WD_ALIGN_PARAGRAPH.LEFT
-
-    parts = text.split('**')
-    for i, part in enumerate(parts):
-        if not part:
-            continue
-        run = p.add_run(part)
-        run.font.name = 'Times New Roman'
-        run.font.size = Pt(12)
-        run.font.bold = True if i % 2 == 1 else False
-    return p
-
-def add_page_border(doc):
-    sec_pr = doc.sections[0]._sectPr
-    pg_borders = OxmlElement('w:pgBorders')
-    pg_borders.set(qn('w:offsetFrom'), 'page')
-    for border_name in ('top', 'left', 'bottom', 'right'):
-        border = OxmlElement(f'w:{border_name}')
-        border.set(qn('w:val'), 'single')
-        border.set(qn('w:sz'), '12')
-        border.set(qn('w:space'), '24')
-        border.set(qn('w:color'), 'auto')
-        pg_borders.append(border)
-    sec_pr.append(pg_borders)
-
-def create_word_table(doc, table_lines):
-    if not table_lines:
-        return
-    cleaned_rows = []
-    for line in table_lines:
-        if '---' in line:
-            continue
-        cells = [c.strip() for c in line.strip('|').split('|')]
-        cleaned_rows.append(cells)
-
-    if not cleaned_rows:
-        return
+    tab1, tab2 = st.tabs(["✍️ تعديل", "👁️ معاينة"])
+    with tab1:
+        for idx in range(first, last):
+            key = f"section_{version}_{idx}"
+            if key not in st.session_state:
+                st.session_state[key] = sections[idx]
+            with st.expander(section_title(sections[idx]) or f"جزء {idx + 1}", expanded=last - first == 1):
+                st.text_area("عدل هنا:", key=key, height=300, label_visibility="collapsed",
+                             on_change=save_section, args=(idx, key))
+    with tab2:
+        st.markdown("".join(sections[first:last]))
 
-    table = doc.add_table(rows=len(cleaned_rows), cols=len(cleaned_rows[0]))
-    table.style = 'Table Grid'
-
-    for r_idx, row_data in enumerate(cleaned_rows):
-        row = table.rows[r_idx]
-        for c_idx, cell_text in enumerate(row_data):
-            if c_idx < len(row.cells):
-                cell = row.cells[c_idx]
-                cell.text = ""
-                p = cell.paragraphs[0]
-                add_markdown_paragraph(p, cell_text,
-                                       align=WD_ALIGN_PARAGRAPH.CENTER if r_idx == 0 else None)
-                if r_idx == 0:
-                    for run in p.runs:
-                        run.font.bold = True
-    doc.add_paragraph("")
-
-def create_styled_word_doc(text_content, user_title):
-    doc = Document()
-    add_page_border(doc)
-
-    style = doc.styles['Normal']
-    font = style.font
-    font.name = 'Times New Roman'
-    font.size = Pt(12)
-
-    clean_title = user_title.replace('*', '').replace('#', '').strip()
-    main_heading = doc.add_heading(clean_title, 0)
-    main_heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    for run in main_heading.runs:
-        run.font.name = 'Times New Roman'
-        run.font.size = Pt(16)
-        run.font.bold = True
-        run.font.color.rgb = RGBColor(0, 0, 0)
-
-    lines = text_content.split('\n')
-    table_buffer = []
-
-    for line in lines:
-        line = line.strip()
-        if line.startswith('|') and line.endswith('|'):
-            table_buffer.append(line)
-            continue
-        else:
-            if table_buffer:
-                create_word_table(doc, table_buffer)
-                table_buffer = []
-
-        if not line:
-            continue
-
-        if line.startswith('#'):
-            clean_text = line.lstrip('#').replace('*', '').strip()
-            h = doc.add_heading(clean_text, level=1)
-            h.alignment = WD_ALIGN_PARAGRAPH.RIGHT if any("\u0600" <= c <= "\u06FF" for c in line) else WD_ALIGN_PARAGRAPH.LEFT
-            for run in h.runs:
-                run.font.name = 'Times New Roman'
-                run.font.size = Pt(14)
-                run.font.bold = True
-                run.font.color.rgb = RGBColor(0, 0, 0)
-
-        elif line.startswith('* ') or line.startswith('- '):
-            clean_text = line.lstrip('* ').lstrip('- ').strip()
-            add_markdown_paragraph(doc, clean_text, style='List Bullet')
+def show_conversion_success(params, cache_hits):
+    if params["method"] == "ocr":
+        st.success("✅ تم استخراج النص بنجاح (OCR)!")
+    else:
+        st.success("✅ تم التحويل بنجاح يا دكتور!")
+    cache_caption(cache_hits, "ocr" if params["method"] == "ocr" else "ai")
+    skipped = sum(row["pages"] for row in st.session_state.get('timings', []) if row["stage"] == "dedup.skip")
+    if skipped:
+        st.caption(f"♻️ {skipped} صفحة مكررة اتشالت قبل التحويل (مكانها ملاحظة في النص)")
+    st.balloons()
 
-        else:
-            add_markdown_paragraph(doc, line)
+# ---------------------------------------------------------
+# متابعة التحويل اللي شغال في الخلفية
+# ---------------------------------------------------------
+def show_job(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return
 
-    if table_buffer:
-        create_word_table(doc, table_buffer)
+    if job["status"] in ("queued", "running"):
+        ensure_workers(JOB_WORKERS, api_keys)
+        st.markdown(job["message"] or "**⏳ في الطابور.. ثواني وهنبدأ** 📿")
+        st.progress(min(1.0, job["progress"]))
+        files_line = "  ".join(("✅ " if state == "done" else "⏳ ") + name
+                               for name, state in job["file_status"].items())
+        st.caption(files_line)
+        if job["partial"]:
+            with st.expander("✍️ النص بيوصل أول بأول", expanded=True):
+                st.markdown(preview_tail(job["partial"]))
+        st.caption("🔖 لو الصفحة اتقفلت أو النت فصل، افتح نفس اللينك تاني وهتلاقي التحويل مكمل.")
+        time.sleep(1)
+        st.rerun()
+
+    elif job["status"] == "done":
+        if st.session_state.get('job_loaded') != job_id:
+            st.session_state['job_loaded'] = job_id
+            st.session_state['converted_text'] = job["result"]
+            st.session_state['timings'] = job["timings"]
+            show_conversion_success(job["params"], job["cache_hits"])
+
+    elif job["error_kind"] == "quota":
+        st.error("🛑 تم الوصول للحد الأقصى اليومي لاستخدام الذكاء الاصطناعي.")
+        if st.button("اضغط هنا للتحويل باستخدام OCR فورًا 📄"):
+            params = dict(job["params"], method="ocr", ocr_max_workers=OCR_MAX_WORKERS)
+            start_job(resubmit_job(job_id, params))
+    elif job["params"]["method"] == "ocr":
+        st.error(f"خطأ أثناء OCR: {job['error']}")
+    else:
+        st.error(f"خطأ تقني: {job['error']}")
 
-    bio = io.BytesIO()
-    doc.save(bio)
-    bio.seek(0)
-    return bio
+def start_job(job_id):
+    ensure_workers(JOB_WORKERS, api_keys)
+    st.session_state['job_id'] = job_id
+    st.query_params['job'] = job_id
+    st.rerun()
 
 # ---------------------------------------------------------
 # UI
@@ -309,13 +253,22 @@ uploaded_files = st.file_uploader(
     accept_multiple_files=True
 )
 st.caption("💡 نصيحة أخوية: عشان الموقع يشتغل بسرعة، يفضل ترفع **10-15 صورة** أو **ملف PDF واحد (لا يزيد عن 50 صفحة)** في المرة الواحدة.")
+if DEDUP_MODE == "exact":
+    # الـ dHash ما بيفرقش بين سلايدين مختلفين في سطر، فالتكرار التقريبي مش شغال غير بـ MEDMATE_DEDUP=near
+    st.caption("♻️ الملفات والصفحات المتطابقة بالظبط بس هي اللي بتتشال. "
+               "لو صورت نفس السلايد مرتين هتتحول مرتين، فشيل الصورة الزيادة قبل الرفع.")
 
 st.write("---")
 processing_method = st.radio(
     "⚙️ اختر طريقة المعالجة:",
-    ["الذكاء الاصطناعي (AI) - تنسيق ممتاز ✨", "نظام OCR العادي - Tesseract (مجاني بلا حدود) 📄"],
+    ["الذكاء الاصطناعي (AI) - تنسيق ممتاز ✨", "نظام OCR العادي - Tesseract (مجاني بلا حدود) 📄",
+     "هجين (OCR + AI) - الصفحات الواضحة بـ OCR والباقي بالذكاء الاصطناعي ⚡"],
     index=0
 )
+enhance_images = False
+if "OCR" in processing_method:
+    enhance_images = st.checkbox("🧹 تحسين الصور قبل OCR (تصغير، تعديل الميل، وقص الحواف)")
+show_timings = st.checkbox("⏱️ اعرض الوقت اللي أخدته كل مرحلة")
 st.write("---")
 
 # 1. القائمة المنسدلة (خلينا الاختيارات عربي عشان التناسق)
@@ -346,108 +299,46 @@ with col2:
 if st.button("توكلنا على الله.. ابدأ التحويل 🚀"):
     if not uploaded_files:
         st.warning("⚠️ الرجاء رفع الملفات أولاً.")
-    elif not api_key and "AI" in processing_method:
+    elif not api_keys and "AI" in processing_method:
         st.error("⚠️ لم يتم العثور على مفتاح API في الإعدادات! يرجى التواصل مع المطور.")
     else:
-        status_text = st.empty()
-        progress_bar = st.progress(0)
-
-        image_files = [f for f in uploaded_files if f.type.startswith("image/")]
-        pdf_files = [f for f in uploaded_files if f.type == "application/pdf"]
-        final_content = ""
-
-        # -------------------------------------------------
-        # مسار OCR
-        # -------------------------------------------------
-        if "OCR" in processing_method:
-            try:
-                final_content = process_with_standard_ocr(uploaded_files, status_text)
-                st.session_state['converted_text'] = final_content
-                status_text.success("✅ تم استخراج النص بنجاح (OCR)!")
-                st.balloons()
-            except Exception as e:
-                st.error(f"خطأ أثناء OCR: {e}")
-
-        # -------------------------------------------------
-        # مسار الذكاء الاصطناعي
-        # -------------------------------------------------
+        params = {
+            "method": "hybrid" if "هجين" in processing_method else "ocr" if "OCR" in processing_method else "ai",
+            "doc_type": doc_type_selection,
+            "is_handwritten": is_handwritten,
+            "preprocess": enhance_images,
+            "ocr_max_workers": OCR_MAX_WORKERS,
+        }
+
+        if JOB_WORKERS > 0:
+            start_job(submit_job(uploaded_files, params))
         else:
+            status_text = st.empty()
+            progress_bar = st.progress(0)
+            preview_box = st.empty()
             try:
-                genai.configure(api_key=api_key)
-                model = genai.GenerativeModel('gemini-flash-latest')
-
-                # ---- دمج الصور في PDF واحد ----
-                if image_files:
-                    zikr_update(status_text, "📦 جاري دمج الصور")
-                    pdf_data = convert_images_to_pdf(image_files)
-                    if not pdf_data:
-                        raise RuntimeError("فشل دمج الصور.")
-
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                        tmp.write(pdf_data.read())
-                        temp_name = tmp.name
-
-                    try:
-                        zikr_update(status_text, "📤 جاري رفع الملف")
-                        g_file = genai.upload_file(temp_name)
-
-                        for _ in range(60):
-                            zikr_update(status_text, "⏳ انتظار معالجة الملف")
-                            time.sleep(2)
-                            g_file = genai.get_file(g_file.name)
-                            if g_file.state.name != "PROCESSING":
-                                break
-                        else:
-                            raise TimeoutError("انتهت مهلة معالجة الملف.")
-
-                        zikr_update(status_text, "🧠 جاري التحليل بالذكاء الاصطناعي")
-                        response = model.generate_content(
-                            [get_medical_prompt(doc_type_selection, is_handwritten), g_file]
-                        )
-                        final_content += response.text
-                        progress_bar.progress(0.5 if pdf_files else 1.0)
-                    finally:
-                        os.remove(temp_name)
-
-                # ---- معالجة ملفات PDF ----
-                for i, pdf in enumerate(pdf_files):
-                    zikr_update(status_text, f"📑 جاري تحليل {pdf.name}")
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                        tmp.write(pdf.getvalue())
-                        temp_pdf = tmp.name
-
-                    try:
-                        g_pdf = genai.upload_file(temp_pdf)
-                        for _ in range(60):
-                            zikr_update(status_text, "⏳ انتظار معالجة الملف")
-                            time.sleep(2)
-                            g_pdf = genai.get_file(g_pdf.name)
-                            if g_pdf.state.name != "PROCESSING":
-                                break
-                        else:
-                            raise TimeoutError("انتهت مهلة معالجة الملف.")
-
-                        zikr_update(status_text, "🧠 جاري التحليل بالذكاء الاصطناعي")
-                        response = model.generate_content(
-                            [get_medical_prompt(doc_type_selection, is_handwritten), g_pdf]
-                        )
-                        final_content += f"\n\nSource: {pdf.name}\n" + response.text
-                        progress_bar.progress((i + 1) / len(pdf_files))
-                    finally:
-                        os.remove(temp_pdf)
-
+                if params["method"] != "ocr":
+                    set_api_keys(api_keys)
+                with collect() as trace:
+                    final_content, cache_hits = run_conversion(
+                        uploaded_files, params, status_text, progress_bar,
+                        on_preview=lambda text: preview_box.markdown(preview_tail(text)))
                 st.session_state['converted_text'] = final_content
-                status_text.success("✅ تم التحويل بنجاح يا دكتور!")
-                st.balloons()
+                st.session_state['timings'] = trace.summary()
+                status_text.empty()
+                preview_box.empty()
+                show_conversion_success(params, cache_hits)
 
             # ---- Fallback تلقائي للـ OCR عند نفاذ الرصيد ----
             except Exception as e:
-                error_msg = str(e).lower()
-                if "429" in error_msg or "quota" in error_msg:
+                if params["method"] == "ocr":
+                    st.error(f"خطأ أثناء OCR: {e}")
+                elif is_quota_error(e):
                     st.error("🛑 تم الوصول للحد الأقصى اليومي لاستخدام الذكاء الاصطناعي.")
                     if st.button("اضغط هنا للتحويل باستخدام OCR فورًا 📄"):
                         try:
-                            final_content = process_with_standard_ocr(uploaded_files, status_text)
+                            final_content, _ = run_conversion(uploaded_files, dict(params, method="ocr"),
+                                                              status_text, progress_bar)
                             st.session_state['converted_text'] = final_content
                             st.rerun()
                         except Exception as ex:
@@ -455,12 +346,18 @@ if st.button("توكلنا على الله.. ابدأ التحويل 🚀"):
                 else:
                     st.error(f"خطأ تقني: {e}")
 
+# الرجوع لآخر تحويل (حتى بعد refresh أو فصل النت) عن طريق رقمه في اللينك
+active_job = st.session_state.get('job_id') or st.query_params.get('job')
+if active_job:
+    show_job(active_job)
+
 # ---------------------------------------------------------
 # عرض النتائج
 # ---------------------------------------------------------
 if st.session_state['converted_text']:
     st.divider()
-    docx_file = create_styled_word_doc(st.session_state['converted_text'], user_filename)
+    with collect() as docx_trace:
+        docx_file = create_styled_word_doc(st.session_state['converted_text'], user_filename)
     st.success("🎉 اتفضل يا دكتور، ملفك جاهز!")
     st.download_button(
         label=f"💾 تحميل ملف الوورد ({user_filename}.docx)",
@@ -470,13 +367,11 @@ if st.session_state['converted_text']:
     )
 
     st.subheader("📝 مراجعة النص")
-    tab1, tab2 = st.tabs(["✍️ تعديل", "👁️ معاينة"])
-    with tab1:
-        edited = st.text_area("عدل هنا:", value=st.session_state['converted_text'],
-                              height=400, label_visibility="collapsed")
-        st.session_state['converted_text'] = edited
-    with tab2:
-        st.markdown(st.session_state['converted_text'])
+    show_review()
+
+    if show_timings:
+        with st.expander("⏱️ الوقت بالتفصيل", expanded=True):
+            timing_table(st.session_state.get('timings', []) + docx_trace.summary())
 
 
 
@@ -0,0 +1,18 @@
+import random
+
+# ---------------------------------------------------------
+# أذكار
+# ---------------------------------------------------------
+AZKAR_LIST = [
+    "سبحان الله وبحمده، سبحان الله العظيم 🌿",
+    "اللهم صل وسلم وبارك على نبينا محمد ﷺ",
+    "لا حول ولا قوة إلا بالله العلي العظيم",
+    "أستغفر الله العظيم وأتوب إليه",
+    "سبحان الله، والحمد لله، ولا إله إلا الله، والله أكبر",
+    "اللهم إنك عفو كريم تحب العفو فاعف عنا",
+    "يا حي يا قيوم برحمتك أستغيث",
+    "ربّ اشرح لي صدري ويسّر لي أمري"
+]
+
+def zikr_update(box, prefix="⏳ جاري المعالجة"):
+    box.markdown(f"**{prefix}.. {random.choice(AZKAR_LIST)}** 📿")
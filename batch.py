@@ -0,0 +1,213 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from common import NullBox
+
+# ---------------------------------------------------------
+# تحويل كورس كامل من الـ terminal من غير Streamlit:
+#   python batch.py ~/Courses/Pharma --method ai --doc-type mcq --workers 3
+# كل ملف بيطلع جنبه <الاسم>.docx و <الاسم>.md، والتقدم بيتسجل في manifest
+# فلو التشغيل وقف أو اتقفل، نفس الأمر بيكمل من غير ما يعيد الملفات اللي خلصت
+# ---------------------------------------------------------
+MANIFEST_NAME = ".medmate_batch.json"
+
+FILE_TYPES = {
+    ".pdf": "application/pdf",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+}
+
+# نفس المفاتيح اللي get_medical_prompt بيفهمها
+DOC_TYPES = {
+    "notes": "Lecture / Notes",
+    "mcq": "Exam / MCQ",
+}
+
+def find_sources(root):
+    # الملفات المدعومة تحت root بترتيب ثابت، من غير الفولدرات المخفية
+    sources = []
+    for folder, dirs, names in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in FILE_TYPES and not name.startswith("."):
+                sources.append(os.path.join(folder, name))
+    return sources
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def output_paths(sources, formats):
+    # lec1.pdf -> lec1.docx، ولو فيه lec1.pdf و lec1.jpg في نفس الفولدر بيبقوا lec1.pdf.docx و lec1.jpg.docx
+    stems = {}
+    for path in sources:
+        stem = os.path.splitext(path)[0]
+        stems[stem] = stems.get(stem, 0) + 1
+    outputs = {}
+    for path in sources:
+        stem = os.path.splitext(path)[0]
+        stem = path if stems[stem] > 1 else stem
+        outputs[path] = {fmt: f"{stem}.{fmt}" for fmt in formats}
+    return outputs
+
+# ---------------------------------------------------------
+# الـ manifest: حالة كل ملف بمساره النسبي
+# ---------------------------------------------------------
+def load_manifest(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"files": {}}
+
+def save_manifest(path, manifest):
+    # كتابة في ملف مؤقت وبعدين replace عشان Ctrl+C في النص ما يبوظش الملف
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+def is_done(entry, digest, params, outputs, root):
+    # الملف اتحول قبل كده بنفس المحتوى ونفس الإعدادات، والملفات الناتجة لسه موجودة
+    # (المسارات في الـ manifest نسبية عشان الفولدر كله ممكن يتنقل)
+    return (entry is not None and entry.get("status") == "done" and entry.get("sha256") == digest
+            and entry.get("params") == params
+            and all(entry.get("outputs", {}).get(fmt) == os.path.relpath(out, root) for fmt, out in outputs.items())
+            and all(os.path.exists(out) for out in outputs.values()))
+
+# ---------------------------------------------------------
+# جوه كل process
+# ---------------------------------------------------------
+def init_worker(ocr_workers, processes):
+    # الأنوية وحد Gemini في الدقيقة بيتقسموا على الـ processes بدل ما كل واحدة تاخدهم كلهم
+    # (زي jobs.ensure_workers)، وقبل import عشان الإعدادات بتتقري وقتها
+    os.environ.setdefault("MEDMATE_OCR_WORKERS", str(ocr_workers))
+    os.environ.setdefault("MEDMATE_GEMINI_PROCESSES", str(processes))
+    from gemini_scheduler import parse_api_keys, set_api_keys
+
+    api_keys = parse_api_keys(os.environ.get("GEMINI_API_KEYS")) + parse_api_keys(os.environ.get("GEMINI_API_KEY"))
+    if api_keys:
+        set_api_keys(api_keys)
+
+def convert_file(path, params, outputs):
+    # outputs: {الصيغة: المسار}، وبيرجع (المسار، عدد مرات الكاش، الوقت)
+    from converter import run_conversion
+    from uploads import UploadedBlob
+    from word_export import create_styled_word_doc
+
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        blob = UploadedBlob(os.path.basename(path), FILE_TYPES[os.path.splitext(path)[1].lower()], f.read())
+    text, cache_hits = run_conversion([blob], params, NullBox())
+
+    title = os.path.splitext(os.path.basename(path))[0]
+    for fmt, out in outputs.items():
+        data = create_styled_word_doc(text, title).getvalue() if fmt == "docx" else text.encode("utf-8")
+        tmp = out + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, out)
+    return path, cache_hits, time.perf_counter() - start
+
+def _convert_file_safe(path, params, outputs):
+    # الـ traceback بيتطبع من جوه الـ process، والخطأ بيرجع كنص عشان الـ pool يكمل الباقي
+    try:
+        return convert_file(path, params, outputs), None
+    except Exception as e:
+        from gemini_pipeline import is_quota_error
+
+        traceback.print_exc()
+        return (path, 0, 0.0), ("quota" if is_quota_error(e) else "error", str(e))
+
+# ---------------------------------------------------------
+# التشغيل
+# ---------------------------------------------------------
+def run_batch(root, params, formats, workers, manifest_path=None, force=False):
+    root = os.path.abspath(root)
+    manifest_path = manifest_path or os.path.join(root, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    entries = manifest.setdefault("files", {})
+
+    sources = find_sources(root)
+    outputs = output_paths(sources, formats)
+    todo = []
+    skipped = 0
+    for path in sources:
+        rel = os.path.relpath(path, root)
+        digest = file_digest(path)
+        if not force and is_done(entries.get(rel), digest, params, outputs[path], root):
+            skipped += 1
+            continue
+        entries[rel] = {"status": "pending", "sha256": digest, "params": params}
+        todo.append(path)
+    save_manifest(manifest_path, manifest)
+    print(f"📚 {len(todo)} ملف محتاج تحويل ({skipped} خلصوا قبل كده)")
+
+    failed = 0
+    if todo:
+        cpus = os.cpu_count() or 1
+        workers = max(1, min(workers, len(todo)))
+        # spawn بدل fork: الـ threads والـ clients اللي في الـ process الأساسية ما بتتنسخش
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker,
+                                 initargs=(max(1, cpus // workers), workers)) as pool:
+            futures = [pool.submit(_convert_file_safe, path, params, outputs[path]) for path in todo]
+            for done, future in enumerate(as_completed(futures), 1):
+                (path, cache_hits, seconds), error = future.result()
+                rel = os.path.relpath(path, root)
+                entry = entries[rel]
+                if error is None:
+                    entry.update(status="done", cache_hits=cache_hits,
+                                 outputs={fmt: os.path.relpath(out, root) for fmt, out in outputs[path].items()},
+                                 seconds=round(seconds, 2), finished=time.time())
+                    entry.pop("error", None)
+                    print(f"[{done}/{len(todo)}] ✅ {rel} ({seconds:.1f}s)")
+                else:
+                    failed += 1
+                    entry.update(status="failed", error_kind=error[0], error=error[1], finished=time.time())
+                    print(f"[{done}/{len(todo)}] ❌ {rel}: {error[1]}")
+                save_manifest(manifest_path, manifest)
+
+    print(f"🎉 خلص: {len(todo) - failed} اتحولوا، {failed} فشلوا، {skipped} كانوا جاهزين")
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description="تحويل كل ملفات الكورس (PDF وصور) لـ Word و Markdown")
+    parser.add_argument("root", help="الفولدر اللي فيه الملفات (بيدور جوه الفولدرات اللي تحته كمان)")
+    parser.add_argument("--method", choices=["ai", "ocr", "hybrid"], default="ai")
+    parser.add_argument("--doc-type", choices=sorted(DOC_TYPES), default="notes")
+    parser.add_argument("--handwritten", action="store_true", help="الملفات فيها خط يد")
+    parser.add_argument("--preprocess", action="store_true", help="تحسين الصور قبل OCR")
+    parser.add_argument("--formats", nargs="+", choices=["docx", "md"], default=["docx", "md"])
+    parser.add_argument("--workers", type=int, default=2, help="عدد الملفات اللي بتتحول في نفس الوقت")
+    parser.add_argument("--manifest", help=f"مكان ملف التقدم (الافتراضي: {MANIFEST_NAME} جوه الفولدر)")
+    parser.add_argument("--force", action="store_true", help="إعادة تحويل كل الملفات حتى اللي خلصت")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.root):
+        parser.error(f"الفولدر مش موجود: {args.root}")
+    if args.method != "ocr" and not (os.environ.get("GEMINI_API_KEYS") or os.environ.get("GEMINI_API_KEY")):
+        parser.error("حط GEMINI_API_KEY أو GEMINI_API_KEYS في الـ environment، أو استخدم --method ocr")
+
+    params = {
+        "method": args.method,
+        "doc_type": DOC_TYPES[args.doc_type],
+        "is_handwritten": args.handwritten,
+        "preprocess": args.preprocess,
+    }
+    failed = run_batch(args.root, params, list(dict.fromkeys(args.formats)), args.workers,
+                       args.manifest, args.force)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,448 @@
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from types import SimpleNamespace
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+from common import NullBox
+from uploads import UploadedBlob
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ---------------------------------------------------------
+# قياس سرعة MedMate من غير نت
+#   python benchmark.py --json results.json
+#   python benchmark.py --json new.json --compare results.json
+# الملفات بتتولد بـ seed ثابت فكل تشغيل بيقيس نفس الشغل بالظبط،
+# وكل حالة بتشتغل في process لوحدها عشان ذاكرتها (RSS) ما تتخلطش باللي قبلها
+# ---------------------------------------------------------
+FONT_CANDIDATES = [
+    os.environ.get("MEDMATE_BENCH_FONT", ""),
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/noto/NotoNaskhArabic-Regular.ttf",
+    "C:/Windows/Fonts/arial.ttf",
+]
+
+ARABIC_LINES = [
+    "الضغط المرتفع من أهم أسباب الجلطات",
+    "الجرعة المعتادة للباراسيتامول ٥٠٠ مجم كل ٦ ساعات",
+    "أعراض نقص السكر: رعشة وعرق وزغللة",
+    "لازم نسأل المريض عن الحساسية قبل أي مضاد حيوي",
+]
+ENGLISH_LINES = [
+    "Hypertension: systolic >= 140 mmHg or diastolic >= 90 mmHg",
+    "Acetaminophen overdose -> N-acetylcysteine within 8 hours",
+    "Type 2 DM: metformin is first line unless contraindicated",
+    "Beta blockers are contraindicated in acute decompensated HF",
+]
+
+def load_font(size):
+    for path in FONT_CANDIDATES:
+        if path and os.path.exists(path):
+            return ImageFont.truetype(path, size)
+    return ImageFont.load_default()
+
+# ---------------------------------------------------------
+# الملفات التجريبية
+# ---------------------------------------------------------
+def printed_page(rng, width=1240, height=1754):
+    # صفحة مطبوعة عربي وإنجليزي بـ 150 DPI تقريبًا
+    page = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(page)
+    font = load_font(28)
+    y = 80
+    while y < height - 100:
+        line = rng.choice(ARABIC_LINES + ENGLISH_LINES)
+        draw.text((80, y), line, fill="black", font=font)
+        y += 46
+    return page
+
+def handwritten_page(rng, width=1600, height=2200):
+    # صورة موبايل: خط مايل ومهزوز، إضاءة مش متساوية، وحواف ترابيزة
+    page = Image.new("L", (width, height), 235)
+    draw = ImageDraw.Draw(page)
+    for x in range(width):
+        draw.line([(x, 0), (x, height)], fill=235 - x * 60 // width)
+    font = load_font(34)
+    y = 120
+    while y < height - 160:
+        x = 100
+        for word in rng.choice(ENGLISH_LINES + ARABIC_LINES).split():
+            draw.text((x, y + rng.randint(-4, 4)), word, fill=rng.randint(20, 70), font=font)
+            x += 24 * len(word) + rng.randint(10, 30)
+            if x > width - 200:
+                break
+        y += 60 + rng.randint(-6, 6)
+    page = page.rotate(rng.uniform(-3, 3), expand=True, fillcolor=40).filter(ImageFilter.GaussianBlur(0.8))
+    return page.convert("RGB")
+
+def to_bytes(image, fmt="JPEG"):
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, quality=85)
+    return buffer.getvalue()
+
+def make_pdf(pages):
+    buffer = io.BytesIO()
+    pages[0].save(buffer, format="PDF", save_all=True, append_images=pages[1:], resolution=150)
+    return buffer.getvalue()
+
+def mcq_markdown(rng, questions):
+    # مذكرة زي اللي بيرجعها Gemini: عناوين وبوينتس وجداول MCQ كبيرة
+    lines = ["# MedMate Revision", "## أسئلة الباطنة", ""]
+    for start in range(0, questions, 50):
+        lines += ["| # | Question | A | B | C | D | Answer |", "|---|---|---|---|---|---|---|"]
+        for q in range(start, min(start + 50, questions)):
+            stem = rng.choice(ENGLISH_LINES + ARABIC_LINES)
+            options = [rng.choice(["Metformin", "Insulin", "**Aspirin**", "Heparin", "لا شيء مما سبق"])
+                       for _ in range(4)]
+            lines.append(f"| {q + 1} | {stem} | " + " | ".join(options) + f" | {rng.choice('ABCD')} |")
+        lines += ["", f"* ملاحظة: {rng.choice(ARABIC_LINES)}", f"* Note: **{rng.choice(ENGLISH_LINES)}**", ""]
+    return "\n".join(lines)
+
+def build_corpus(seed=0, scale=1):
+    rng = random.Random(seed)
+    printed = [printed_page(rng) for _ in range(4 * scale)]
+    return {
+        "photos": [UploadedBlob(f"photo_{i}.jpg", "image/jpeg", to_bytes(handwritten_page(rng)))
+                   for i in range(6 * scale)],
+        "scans": [UploadedBlob(f"scan_{i}.png", "image/png", to_bytes(page, "PNG"))
+                  for i, page in enumerate(printed)],
+        "pdfs": [UploadedBlob("lecture_short.pdf", "application/pdf", make_pdf(printed[:3])),
+                 UploadedBlob("lecture_long.pdf", "application/pdf", make_pdf(printed * (6 * scale)))],
+        # ورق صغير (صفحتين) بكميات: الحالة اللي الطلبات المجمعة معمولة عشانها
+        "handouts": [UploadedBlob(f"handout_{i}.pdf", "application/pdf", make_pdf(printed[i % 2:i % 2 + 2]))
+                     for i in range(8 * scale)],
+        "notes": mcq_markdown(rng, 1000 * scale),
+    }
+
+# ---------------------------------------------------------
+# Gemini وهمي: نفس واجهة google.generativeai بتأخير ثابت
+# ---------------------------------------------------------
+class FakeGenai:
+    def __init__(self, upload_latency=0.2, active_after=0.5, generate_latency=1.0, page_latency=0.05):
+        self.upload_latency = upload_latency
+        self.active_after = active_after
+        self.generate_latency = generate_latency
+        self.page_latency = page_latency
+        self.files = {}
+        self.lock = threading.Lock()
+        fake = self
+
+        class GenerativeModel:
+            def __init__(self, model_name, **kwargs):
+                self.model_name = model_name
+
+            def generate_content(self, parts, stream=False, **kwargs):
+                return fake.generate_stream(parts) if stream else fake.generate(parts)
+
+        self.GenerativeModel = GenerativeModel
+
+    def configure(self, **kwargs):
+        pass
+
+    def upload_file(self, path, **kwargs):
+        time.sleep(self.upload_latency)
+        if hasattr(path, "read"):
+            data = path.read()
+        else:
+            with open(path, "rb") as f:
+                data = f.read()
+        with self.lock:
+            name = f"files/{len(self.files)}"
+            self.files[name] = (data, time.monotonic() + self.active_after)
+        return self._state(name)
+
+    def get_file(self, name):
+        return self._state(name)
+
+    def _state(self, name):
+        data, ready_at = self.files[name]
+        state = "ACTIVE" if time.monotonic() >= ready_at else "PROCESSING"
+        return SimpleNamespace(name=name, state=SimpleNamespace(name=state))
+
+    def generate(self, parts):
+        data, _ = self.files[parts[-1].name]
+        pages = max(1, data.count(b"/Type /Page") - data.count(b"/Type /Pages"))
+        time.sleep(self.generate_latency + self.page_latency * pages)
+        return SimpleNamespace(text=self._transcript(pages, parts[0]))
+
+    def generate_stream(self, parts):
+        # أول نص بعد generate_latency، وبعدها صفحة كل page_latency (زي Gemini بالظبط تقريبًا)
+        data, _ = self.files[parts[-1].name]
+        pages = max(1, data.count(b"/Type /Page") - data.count(b"/Type /Pages"))
+        text = self._transcript(pages, parts[0])
+        step = -(-len(text) // pages)
+        time.sleep(self.generate_latency)
+        for start in range(0, len(text), step):
+            yield SimpleNamespace(text=text[start:start + step])
+            time.sleep(self.page_latency)
+
+    def _transcript(self, pages, prompt=""):
+        # الطلب المجمع: نفس علامات FILE اللي الـ prompt بيطلبها قبل كل ملف
+        files = re.findall(r"FILE (\d+): pages (\d+)-(\d+)", prompt)
+        if files:
+            return "".join(f"===== FILE {number} =====\n" + self._transcript(int(last) - int(first) + 1) + "\n"
+                           for number, first, last in files)
+        return f"# Transcript\n\n* {pages} pages\n\n" + mcq_markdown(random.Random(pages), 20)
+
+def install_fake_genai(fake):
+    import gemini_pipeline
+    import gemini_scheduler
+
+    gemini_pipeline.genai = fake
+    gemini_scheduler.genai = fake
+    # حد الطلبات بيقيس الانتظار مش الكود، فبنقفله هنا
+    gemini_scheduler.SCHEDULER.bucket = gemini_scheduler.TokenBucket(0)
+
+# ---------------------------------------------------------
+# القياس
+# ---------------------------------------------------------
+def current_rss():
+    # RSS الحالي بالبايت (فيه buffers الصور جوه PIL و Tesseract، مش ذاكرة بايثون بس)، أو None
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+def max_rss():
+    # أعلى RSS للـ process كلها (ru_maxrss بالـ KB على Linux وبالبايت على macOS)
+    if resource is None:
+        return None
+    value = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return value if sys.platform == "darwin" else value * 1024
+
+class RssSampler:
+    # بيقرا الـ RSS كل interval في thread جانبي ويفتكر أعلاه
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = current_rss()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.done.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        if self.peak is not None:
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.peak is not None:
+            self.done.set()
+            self.thread.join()
+            self.peak = max(self.peak, current_rss())
+
+def measure(fn, repeat, setup=None):
+    # بيتنادى جوه process الحالة: الذاكرة الأول (قبل ما تشغيلات الوقت تكبّر الـ heap)، وبعدها الوقت
+    # setup بيشتغل قبل كل مرة وما بيدخلش في القياس
+    if setup is not None:
+        setup()
+    base = current_rss()
+    with RssSampler() as sampler:
+        fn()
+    peak = sampler.peak
+    if peak is None:
+        # من غير طريقة نقرا بيها الـ RSS الحالي: أعلى RSS للـ process كلها (فيها بناء الملفات التجريبية)
+        peak = max_rss()
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    maxrss = max_rss()
+    mb = lambda value: value / 2 ** 20 if value is not None else None
+    return {
+        "seconds": times,
+        "median_seconds": statistics.median(times),
+        "min_seconds": min(times),
+        # peak_rss_mb: أعلى RSS وقت التشغيلة، و rss_growth_mb: الزيادة عن قبلها
+        "base_rss_mb": mb(base),
+        "peak_rss_mb": mb(peak),
+        "rss_growth_mb": mb(peak - base) if peak is not None and base is not None else None,
+        "max_rss_mb": mb(maxrss),
+    }
+
+def ocr_available():
+    from pdf_pages import rasterizer_available
+    from tesseract_backend import resolve_backend, tesseract_cmd
+
+    backend = resolve_backend()
+    if backend == "tesserocr":
+        return True, rasterizer_available()
+    return bool(shutil.which(tesseract_cmd())), rasterizer_available()
+
+# الحالات اللي بتحتاج Tesseract بتتشال لو مش موجود
+OCR_CASES = ("ocr_standard", "hybrid")
+CASE_NAMES = ("convert_images_to_pdf", "ai_pipeline", "ai_handouts", "word_xml_cold", "word_xml_edit",
+              "word_python_docx") + OCR_CASES
+
+def benchmark_cases(corpus):
+    import word_export
+    import docx_xml
+    from pdf_pages import convert_images_to_pdf
+    from ocr_engine import process_with_standard_ocr
+    from gemini_pipeline import process_with_ai
+    from hybrid import process_hybrid
+    from prompts import get_medical_prompt
+
+    box = NullBox()
+    images = corpus["photos"] + corpus["scans"]
+    notes = corpus["notes"]
+    edited = notes.replace("# MedMate Revision", "# MedMate Revision (2)", 1)
+
+    def clear_word_caches():
+        word_export._doc_cache.clear()
+        docx_xml._fragment_cache.clear()
+
+    def warm_word_caches():
+        # تعديل سطر واحد بعد تحويل كامل (الحالة المعتادة في تاب التعديل)
+        clear_word_caches()
+        word_export.create_styled_word_doc(notes, "Benchmark")
+
+    # كل حالة: (الدالة، setup قبل كل تشغيلة)
+    cases = {
+        "convert_images_to_pdf": (lambda: convert_images_to_pdf(images), None),
+        "ai_pipeline": (lambda: process_with_ai(images, corpus["pdfs"], get_medical_prompt("Lecture Notes", True),
+                                                True, box, box), None),
+        "ai_handouts": (lambda: process_with_ai([], corpus["handouts"], get_medical_prompt("Lecture Notes", True),
+                                                True, box, box), None),
+        "word_xml_cold": (lambda: word_export.create_styled_word_doc(notes, "Benchmark", engine="xml"),
+                          clear_word_caches),
+        "word_xml_edit": (lambda: word_export.create_styled_word_doc(edited, "Benchmark", engine="xml"),
+                          warm_word_caches),
+        "word_python_docx": (lambda: word_export.create_styled_word_doc(notes, "Benchmark", engine="python-docx"),
+                             clear_word_caches),
+    }
+
+    has_tesseract, has_rasterizer = ocr_available()
+    if has_tesseract:
+        ocr_files = images + (corpus["pdfs"] if has_rasterizer else [])
+        cases["ocr_standard"] = (lambda: process_with_standard_ocr(ocr_files, box), None)
+        cases["hybrid"] = (lambda: process_hybrid(ocr_files, get_medical_prompt("Lecture Notes", True), True,
+                                                  box, box), None)
+    return cases
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def run_case(name, seed=0, scale=1, repeat=3, fake=None):
+    # جوه process الحالة: الملفات التجريبية بتتبني من نفس الـ seed فالشغل هو هو في كل process
+    install_fake_genai(fake or FakeGenai())
+    fn, setup = benchmark_cases(build_corpus(seed, scale))[name]
+    gc.collect()
+    return measure(fn, repeat, setup)
+
+def run_benchmarks(seed=0, scale=1, repeat=3, only=None, fake=None):
+    fake = fake or FakeGenai()
+    has_tesseract, _ = ocr_available()
+    skipped = [] if has_tesseract else list(OCR_CASES)
+
+    results = {}
+    for name in CASE_NAMES:
+        if name in skipped or (only and name not in only):
+            continue
+        print(f"{name} ...", flush=True)
+        command = [sys.executable, os.path.abspath(__file__), "--case", name, "--seed", str(seed),
+                   "--scale", str(scale), "--repeat", str(repeat),
+                   "--upload-latency", str(fake.upload_latency), "--active-after", str(fake.active_after),
+                   "--generate-latency", str(fake.generate_latency), "--page-latency", str(fake.page_latency)]
+        # النتيجة آخر سطر في الـ stdout، والأخطاء بتظهر في الـ stderr زي ما هي
+        output = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True).stdout
+        results[name] = json.loads(output.strip().splitlines()[-1])
+    return {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+        "scale": scale,
+        "repeat": repeat,
+        "fake_genai": {
+            "upload_latency": fake.upload_latency,
+            "active_after": fake.active_after,
+            "generate_latency": fake.generate_latency,
+            "page_latency": fake.page_latency,
+        },
+        "skipped": skipped,
+        "results": results,
+    }
+
+def print_report(report, baseline=None):
+    old = (baseline or {}).get("results", {})
+    for name, row in report["results"].items():
+        line = f"{name:24s} {row['median_seconds']:8.3f}s"
+        if row.get("peak_rss_mb") is not None:
+            line += f"  peak RSS {row['peak_rss_mb']:8.1f} MB"
+        if row.get("rss_growth_mb") is not None:
+            line += f" (+{row['rss_growth_mb']:.1f})"
+        if name in old:
+            line += f"   x{row['median_seconds'] / old[name]['median_seconds']:.2f} time"
+            # النتايج القديمة اللي اتقاست بـ tracemalloc (peak_mb) مش بتتقارن بالـ RSS
+            if row.get("peak_rss_mb") is not None and old[name].get("peak_rss_mb"):
+                line += f"  x{row['peak_rss_mb'] / old[name]['peak_rss_mb']:.2f} memory"
+        print(line)
+    for name in report["skipped"]:
+        print(f"{name:24s} skipped (tesseract غير متاح)")
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس سرعة وذاكرة MedMate على ملفات تجريبية")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scale", type=int, default=1, help="تكبير حجم الملفات التجريبية")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="*", help="أسماء الحالات اللي تتقاس بس")
+    parser.add_argument("--upload-latency", type=float, default=0.2)
+    parser.add_argument("--active-after", type=float, default=0.5)
+    parser.add_argument("--generate-latency", type=float, default=1.0)
+    parser.add_argument("--page-latency", type=float, default=0.05)
+    parser.add_argument("--json", help="حفظ النتايج في ملف JSON")
+    parser.add_argument("--compare", help="ملف JSON من تشغيلة قبل كده للمقارنة")
+    # داخلي: run_benchmarks بيشغل كل حالة كده في process جديدة
+    parser.add_argument("--case", choices=CASE_NAMES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    fake = FakeGenai(args.upload_latency, args.active_after, args.generate_latency, args.page_latency)
+    if args.case:
+        print(json.dumps(run_case(args.case, args.seed, args.scale, args.repeat, fake)))
+        return
+    report = run_benchmarks(args.seed, args.scale, args.repeat, args.only, fake)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import os
+
+# ---------------------------------------------------------
+# إعدادات من الـ environment: القيمة الغلط أو الأقل من minimum بترجع للافتراضي
+# (هنا من غير أي import من المشروع عشان كل module يقدر يستخدمها)
+# ---------------------------------------------------------
+def env_int(name, default, minimum=1):
+    try:
+        value = int(os.environ.get(name, ""))
+    except ValueError:
+        return default
+    return value if value >= minimum else default
+
+def env_float(name, default, minimum=0.0):
+    try:
+        value = float(os.environ.get(name, ""))
+    except ValueError:
+        return default
+    return value if value >= minimum else default
+
+# ---------------------------------------------------------
+# بدل st.empty() و st.progress() لما مفيش UI (الـ CLI والـ benchmark)
+# ---------------------------------------------------------
+class NullBox:
+    def markdown(self, text):
+        pass
+
+    def progress(self, fraction):
+        pass
+
+    def empty(self):
+        pass
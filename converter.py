@@ -0,0 +1,49 @@
+from prompts import get_medical_prompt
+from ocr_engine import process_with_standard_ocr
+from gemini_pipeline import process_with_ai
+from hybrid import process_hybrid
+from transcription_cache import get_cache
+from metrics import span
+from dedup import dedupe_files, duplicate_files_note
+
+# ---------------------------------------------------------
+# التحويل كله من غير Streamlit (بيستخدمه الـ UI والـ workers)
+# ---------------------------------------------------------
+def run_conversion(files, params, status_box, progress_bar=None, on_file=None, on_preview=None):
+    # params: method ("ai" أو "ocr" أو "hybrid")، doc_type، is_handwritten، preprocess، ocr_max_workers
+    # بيرجع (النص، عدد الملفات اللي رجعت من الكاش)
+    # on_preview(النص): اللي وصل من Gemini لحد دلوقتي (مش بيتنادى في الـ OCR)
+    with span("convert", method=params["method"], files=len(files),
+              bytes=sum(len(f.getvalue()) for f in files)):
+        # نفس الملف مرفوع مرتين بيتشال من الأول، واسمه بيتبلغ كأنه خلص ومكانه ملاحظة آخر النص
+        files, dropped = dedupe_files(files)
+        if on_file is not None:
+            for f, _ in dropped:
+                on_file(f.name)
+        text, cache_hits = _run_conversion(files, params, status_box, progress_bar, on_file, on_preview)
+        return text + duplicate_files_note(dropped), cache_hits
+
+def _run_conversion(files, params, status_box, progress_bar, on_file, on_preview):
+    cache = get_cache()
+
+    def ocr(ocr_files, on_ocr_file=None):
+        return process_with_standard_ocr(ocr_files, status_box, params.get("ocr_max_workers"),
+                                         cache=cache, preprocess=params.get("preprocess", False),
+                                         on_file=on_ocr_file)
+
+    if params["method"] == "ocr":
+        return ocr(files, on_file)
+
+    prompt = get_medical_prompt(params["doc_type"], params["is_handwritten"])
+    if params["method"] == "hybrid":
+        return process_hybrid(files, prompt, params["is_handwritten"], status_box, progress_bar, cache=cache,
+                              max_workers=params.get("ocr_max_workers"),
+                              preprocess=params.get("preprocess", False), on_file=on_file,
+                              on_preview=on_preview)
+
+    image_files = [f for f in files if f.type.startswith("image/")]
+    pdf_files = [f for f in files if f.type == "application/pdf"]
+    return process_with_ai(image_files, pdf_files, prompt, params["is_handwritten"],
+                           status_box, progress_bar, cache=cache, on_file=on_file,
+                           ocr_fallback=lambda ocr_files: ocr(ocr_files)[0],
+                           on_preview=on_preview)
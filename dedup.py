@@ -0,0 +1,140 @@
+import hashlib
+import io
+import os
+import threading
+from PIL import Image, ImageOps
+from common import env_int
+from metrics import event
+from pdf_pages import pdf_page_total
+
+# "exact" (الافتراضي): الصفحة بتتشال بس لو بكسلاتها هي هي بالظبط (نفس الصفحة اتعملها render تاني
+# أو نفس الصورة اتحفظت تاني). "near": كمان الصور اللي شبه بعض بالـ dHash (نفس الصورة بعد ضغط أو تصغير)،
+# بس ممكن يمسك صفحتين كلام مختلفين في سطر واحد، فمش شغال غير لو اتطلب. "0": من غير إزالة تكرار خالص
+DEDUP_MODE = {"1": "exact", "exact": "exact", "near": "near"}.get(os.environ.get("MEDMATE_DEDUP", "exact"), "off")
+DEDUP_ENABLED = DEDUP_MODE != "off"
+# الـ hash بيتحسب على صورة 17x16 فبيطلع 256 bit (8x8 بيخلي صفحات الكلام المختلفة شبه بعض)
+HASH_SIZE = 16
+# في وضع "near" بس: أقصى عدد bits مختلفة عشان الصفحتين يتحسبوا نفس الصفحة. نفس الصورة بعد ضغط أو تصغير
+# بتفرق لحد ~17، بس سلايد زاد فيها سطر أو اتغير عنوانها ممكن تفرق 3-10 بس
+DEDUP_MAX_DISTANCE = env_int("MEDMATE_DEDUP_DISTANCE", 20, minimum=0)
+# الصفحات اللي فيها سطور قليلة (أو فاضية) الـ hash بتاعها شبه بعض حتى لو الكلام مختلف،
+# فلازم يبقى فيها تفاصيل كفاية، والفرق يبقى صغير بالنسبة لتفاصيلها كمان
+DEDUP_MIN_BITS = 24
+DEDUP_MAX_RATIO = 0.35
+
+# ---------------------------------------------------------
+# Perceptual hash (dHash): كل bit بيقول البكسل ده أفتح من اللي جنبه ولا لأ،
+# فالإضاءة والضغط والمقاس مش بيأثروا فيه
+# ---------------------------------------------------------
+def dhash(image, size=HASH_SIZE):
+    gray = ImageOps.exif_transpose(image).convert("L")
+    pixels = list(gray.resize((size + 1, size), Image.BILINEAR).getdata())
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+def pixel_digest(image):
+    # نفس الحجم ونفس البكسلات بالظبط (بعد ما الصورة تتعدل حسب الـ EXIF)
+    image = ImageOps.exif_transpose(image)
+    digest = hashlib.sha256(f"{image.mode}:{image.size}".encode())
+    digest.update(image.tobytes())
+    return digest.digest()
+
+def same_page(a, b, max_distance=DEDUP_MAX_DISTANCE):
+    detail = min(bin(a).count("1"), bin(b).count("1"))
+    if detail < DEDUP_MIN_BITS:
+        return False
+    return hamming(a, b) <= min(max_distance, detail * DEDUP_MAX_RATIO)
+
+class PageDeduper:
+    # بيفتكر الصفحات اللي عدت في التحويل ده، وبيرجع اسم الصفحة الأصلية لو الجديدة نسخة منها
+    def __init__(self, max_distance=DEDUP_MAX_DISTANCE, mode=DEDUP_MODE):
+        self.max_distance = max_distance
+        self.mode = mode
+        self.seen = []
+        self.exact = {}
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    def check(self, image, label):
+        if self.mode == "off":
+            return None
+        digest = pixel_digest(image)
+        value = dhash(image) if self.mode == "near" else None
+        with self.lock:
+            original = self.exact.get(digest)
+            if original is None and value is not None:
+                original = next((other_label for other, other_label in self.seen
+                                 if same_page(value, other, self.max_distance)), None)
+            if original is not None:
+                self.skipped += 1
+                event("dedup.skip", pages=1)
+                return original
+            self.exact[digest] = label
+            if value is not None:
+                self.seen.append((value, label))
+        return None
+
+def duplicate_note(label):
+    return f"♻️ (صفحة مكررة: نفس {label}، اتشالت)\n"
+
+def dedupe_items(items, deduper, skipped=None):
+    # فوق items بتاعة ocr_stream: الصفحة المكررة بتتحول لعنوانها + ملاحظة بدل الصورة
+    # وبيتسجل الـ group بتاعها في skipped (عشان نص الملف ده ما يتخزنش في الكاش لوحده)
+    for item in items:
+        if len(item) == 3:
+            group, header, image = item
+            original = deduper.check(image, header.strip("\n -"))
+            if original is not None:
+                if skipped is not None:
+                    skipped.add(group)
+                item = (group, header + duplicate_note(original))
+        yield item
+
+# ---------------------------------------------------------
+# على مستوى الملفات
+# ---------------------------------------------------------
+def dedupe_files(files):
+    # نفس الملف بالظبط اترفع مرتين (دفعات متداخلة): بيرجع (الملفات من غير تكرار، [(الملف اللي اتشال، اسم الأصلي)])
+    if not DEDUP_ENABLED:
+        return list(files), []
+    seen = {}
+    unique = []
+    dropped = []
+    for f in files:
+        digest = hashlib.sha256(f.getvalue()).digest()
+        if digest in seen:
+            pages = (pdf_page_total(f.getvalue()) if f.type == "application/pdf" else None) or 1
+            event("dedup.skip", pages=pages, file=f.name)
+            dropped.append((f, seen[digest]))
+            continue
+        seen[digest] = f.name
+        unique.append(f)
+    return unique, dropped
+
+def duplicate_files_note(dropped):
+    # عنوان + ملاحظة لكل ملف اتشال، بتتحط آخر النص عشان الملف ما يختفيش من غير أثر
+    return "".join(f"\n\nSource: {f.name}\n" + duplicate_note(original) for f, original in dropped)
+
+def dedupe_images(image_files, deduper=None):
+    # للصور اللي بتتدمج وتترفع لـ Gemini: بيرجع (الصور من غير النسخ المكررة، [(اسم الصورة اللي اتشالت، الأصلية)])
+    # عشان اللي اتشال يتكتب عنه ملاحظة في النص بدل ما يختفي
+    deduper = deduper or PageDeduper()
+    if deduper.mode == "off":
+        return list(image_files), []
+    unique = []
+    dropped = []
+    for f in image_files:
+        with Image.open(io.BytesIO(f.getvalue())) as image:
+            original = deduper.check(image, f.name)
+        if original is None:
+            unique.append(f)
+        else:
+            dropped.append((f.name, original))
+    return unique, dropped
@@ -0,0 +1,289 @@
+import io
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+from common import env_int
+
+# ---------------------------------------------------------
+# كتابة ملف Word مباشرة (WordprocessingML) من غير python-docx
+# نفس شكل create_styled_word_doc_reference: إطار الصفحة، المحاذاة يمين/شمال،
+# العناوين، النقط، والجداول
+# ---------------------------------------------------------
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+FONT = "Times New Roman"
+# عرض المساحة المكتوبة في صفحة Letter بهوامش python-docx الافتراضية (twips)
+BLOCK_WIDTH = 8640
+
+# عدد الـ blocks اللي الـ XML بتاعها بيفضل محفوظ بين الـ reruns
+FRAGMENT_CACHE_SIZE = env_int("MEDMATE_DOCX_FRAGMENT_CACHE", 50000, minimum=0)
+
+# حروف تحكم مش مسموحة في XML (tesseract مثلًا بيرجع \x0c)
+_INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>
+<Override PartName="/word/numbering.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.numbering+xml"/>
+<Override PartName="/word/settings.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.settings+xml"/>
+</Types>"""
+
+PACKAGE_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>"""
+
+DOCUMENT_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/numbering" Target="numbering.xml"/>
+<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/settings" Target="settings.xml"/>
+</Relationships>"""
+
+SETTINGS = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:settings xmlns:w="{W_NS}">
+<w:defaultTabStop w:val="720"/>
+<w:characterSpacingControl w:val="doNotCompress"/>
+<w:compat><w:compatSetting w:name="compatibilityMode" w:uri="http://schemas.microsoft.com/office/word" w:val="15"/></w:compat>
+</w:settings>"""
+
+# نفس قيم الـ template بتاع python-docx للستايلات اللي بنستخدمها
+STYLES = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:styles xmlns:w="{W_NS}">
+<w:docDefaults>
+<w:rPrDefault><w:rPr><w:rFonts w:ascii="{FONT}" w:eastAsia="{FONT}" w:hAnsi="{FONT}" w:cs="{FONT}"/><w:sz w:val="22"/><w:szCs w:val="22"/><w:lang w:val="en-US" w:eastAsia="en-US" w:bidi="ar-SA"/></w:rPr></w:rPrDefault>
+<w:pPrDefault><w:pPr><w:spacing w:after="200" w:line="276" w:lineRule="auto"/></w:pPr></w:pPrDefault>
+</w:docDefaults>
+<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/><w:qFormat/><w:rPr><w:rFonts w:ascii="{FONT}" w:hAnsi="{FONT}"/><w:sz w:val="24"/></w:rPr></w:style>
+<w:style w:type="character" w:default="1" w:styleId="DefaultParagraphFont"><w:name w:val="Default Paragraph Font"/><w:uiPriority w:val="1"/><w:semiHidden/><w:unhideWhenUsed/></w:style>
+<w:style w:type="table" w:default="1" w:styleId="TableNormal"><w:name w:val="Normal Table"/><w:uiPriority w:val="99"/><w:semiHidden/><w:unhideWhenUsed/><w:tblPr><w:tblInd w:w="0" w:type="dxa"/><w:tblCellMar><w:top w:w="0" w:type="dxa"/><w:left w:w="108" w:type="dxa"/><w:bottom w:w="0" w:type="dxa"/><w:right w:w="108" w:type="dxa"/></w:tblCellMar></w:tblPr></w:style>
+<w:style w:type="numbering" w:default="1" w:styleId="NoList"><w:name w:val="No List"/><w:uiPriority w:val="99"/><w:semiHidden/><w:unhideWhenUsed/></w:style>
+<w:style w:type="paragraph" w:styleId="Title"><w:name w:val="Title"/><w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:uiPriority w:val="10"/><w:qFormat/><w:pPr><w:pBdr><w:bottom w:val="single" w:sz="8" w:space="4" w:color="4F81BD"/></w:pBdr><w:spacing w:after="300" w:line="240" w:lineRule="auto"/><w:contextualSpacing/></w:pPr><w:rPr><w:spacing w:val="5"/><w:kern w:val="28"/><w:sz w:val="52"/><w:szCs w:val="52"/><w:color w:val="17365D"/></w:rPr></w:style>
+<w:style w:type="paragraph" w:styleId="Heading1"><w:name w:val="heading 1"/><w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:uiPriority w:val="9"/><w:qFormat/><w:pPr><w:keepNext/><w:keepLines/><w:spacing w:before="480" w:after="0"/><w:outlineLvl w:val="0"/></w:pPr><w:rPr><w:b/><w:bCs/><w:color w:val="365F91"/><w:sz w:val="28"/><w:szCs w:val="28"/></w:rPr></w:style>
+<w:style w:type="paragraph" w:styleId="ListBullet"><w:name w:val="List Bullet"/><w:basedOn w:val="Normal"/><w:uiPriority w:val="99"/><w:unhideWhenUsed/><w:pPr><w:numPr><w:numId w:val="1"/></w:numPr><w:contextualSpacing/></w:pPr></w:style>
+<w:style w:type="table" w:styleId="TableGrid"><w:name w:val="Table Grid"/><w:basedOn w:val="TableNormal"/><w:uiPriority w:val="59"/><w:pPr><w:spacing w:after="0" w:line="240" w:lineRule="auto"/></w:pPr><w:tblPr><w:tblBorders><w:top w:val="single" w:sz="4" w:space="0" w:color="auto"/><w:left w:val="single" w:sz="4" w:space="0" w:color="auto"/><w:bottom w:val="single" w:sz="4" w:space="0" w:color="auto"/><w:right w:val="single" w:sz="4" w:space="0" w:color="auto"/><w:insideH w:val="single" w:sz="4" w:space="0" w:color="auto"/><w:insideV w:val="single" w:sz="4" w:space="0" w:color="auto"/></w:tblBorders></w:tblPr></w:style>
+</w:styles>"""
+
+NUMBERING = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:numbering xmlns:w="{W_NS}">
+<w:abstractNum w:abstractNumId="0"><w:multiLevelType w:val="singleLevel"/><w:lvl w:ilvl="0"><w:start w:val="1"/><w:numFmt w:val="bullet"/><w:lvlText w:val="•"/><w:lvlJc w:val="left"/><w:pPr><w:ind w:left="360" w:hanging="360"/></w:pPr></w:lvl></w:abstractNum>
+<w:num w:numId="1"><w:abstractNumId w:val="0"/></w:num>
+</w:numbering>"""
+
+DOCUMENT_HEAD = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:document xmlns:w="{W_NS}"><w:body>"""
+
+BORDERS = "".join(f'<w:{side} w:val="single" w:sz="12" w:space="24" w:color="auto"/>'
+                  for side in ("top", "left", "bottom", "right"))
+
+DOCUMENT_TAIL = ('<w:sectPr><w:pgSz w:w="12240" w:h="15840"/>'
+                 '<w:pgMar w:top="1440" w:right="1800" w:bottom="1440" w:left="1800" '
+                 'w:header="720" w:footer="720" w:gutter="0"/>'
+                 f'<w:pgBorders w:offsetFrom="page">{BORDERS}</w:pgBorders>'
+                 '<w:cols w:space="720"/><w:docGrid w:linePitch="360"/></w:sectPr>'
+                 '</w:body></w:document>')
+
+STATIC_PARTS = [
+    ("[Content_Types].xml", CONTENT_TYPES),
+    ("_rels/.rels", PACKAGE_RELS),
+    ("word/_rels/document.xml.rels", DOCUMENT_RELS),
+    ("word/styles.xml", STYLES),
+    ("word/numbering.xml", NUMBERING),
+    ("word/settings.xml", SETTINGS),
+]
+
+# ---------------------------------------------------------
+# عناصر XML
+# ---------------------------------------------------------
+def is_arabic(text):
+    return any("\u0600" <= c <= "\u06FF" for c in text)
+
+def _text(text):
+    text = escape(_INVALID_XML.sub("", text))
+    # python-docx بيحول الـ tab لـ <w:tab/>
+    return '</w:t><w:tab/><w:t xml:space="preserve">'.join(text.split("\t"))
+
+def run_xml(text, size=24, bold=False, color=None):
+    rpr = f'<w:rFonts w:ascii="{FONT}" w:hAnsi="{FONT}"/>'
+    rpr += '<w:b/>' if bold else '<w:b w:val="0"/>'
+    if color:
+        rpr += f'<w:color w:val="{color}"/>'
+    rpr += f'<w:sz w:val="{size}"/>'
+    return f'<w:r><w:rPr>{rpr}</w:rPr><w:t xml:space="preserve">{_text(text)}</w:t></w:r>'
+
+def paragraph_xml(runs, style=None, jc=None):
+    ppr = ""
+    if style:
+        ppr += f'<w:pStyle w:val="{style}"/>'
+    if jc:
+        ppr += f'<w:jc w:val="{jc}"/>'
+    if ppr:
+        return f'<w:p><w:pPr>{ppr}</w:pPr>{runs}</w:p>'
+    return f'<w:p>{runs}</w:p>'
+
+def markdown_paragraph_xml(text, style=None, align=None, bold_all=False):
+    text = text.replace('***', '**')  # نسيب bold فقط
+    jc = align or ('right' if is_arabic(text) else 'left')
+    runs = "".join(run_xml(part, bold=bold_all or i % 2 == 1)
+                   for i, part in enumerate(text.split('**')) if part)
+    return paragraph_xml(runs, style, jc)
+
+def heading_xml(text, style, jc, size):
+    runs = run_xml(text, size=size, bold=True, color="000000") if text else ""
+    return paragraph_xml(runs, style, jc)
+
+def title_xml(user_title):
+    clean_title = user_title.replace('*', '').replace('#', '').strip()
+    return heading_xml(clean_title, "Title", "center", 32)
+
+def table_xml(table_lines):
+    cleaned_rows = []
+    for line in table_lines:
+        if '---' in line:
+            continue
+        cleaned_rows.append([c.strip() for c in line.strip('|').split('|')])
+    if not cleaned_rows:
+        return ""
+
+    cols = len(cleaned_rows[0])
+    width = BLOCK_WIDTH // cols
+    parts = ['<w:tbl><w:tblPr><w:tblStyle w:val="TableGrid"/><w:tblW w:w="0" w:type="auto"/>'
+             '<w:tblLook w:val="04A0" w:firstRow="1" w:lastRow="0" w:firstColumn="1" '
+             'w:lastColumn="0" w:noHBand="0" w:noVBand="1"/></w:tblPr><w:tblGrid>']
+    parts.append(f'<w:gridCol w:w="{width}"/>' * cols)
+    parts.append('</w:tblGrid>')
+    for r_idx, row_data in enumerate(cleaned_rows):
+        parts.append('<w:tr>')
+        for c_idx in range(cols):
+            if c_idx < len(row_data):
+                para = markdown_paragraph_xml(row_data[c_idx],
+                                              align='center' if r_idx == 0 else None,
+                                              bold_all=r_idx == 0)
+            else:
+                para = '<w:p/>'
+            parts.append(f'<w:tc><w:tcPr><w:tcW w:w="{width}" w:type="dxa"/></w:tcPr>{para}</w:tc>')
+        parts.append('</w:tr>')
+    parts.append('</w:tbl><w:p/>')
+    return "".join(parts)
+
+# ---------------------------------------------------------
+# Markdown -> blocks -> XML
+# ---------------------------------------------------------
+def iter_blocks(text_content):
+    # كل block يا إما سطر واحد يا إما جدول كامل (tuple من السطور)
+    table_buffer = []
+    for line in text_content.split('\n'):
+        line = line.strip()
+        if line.startswith('|') and line.endswith('|'):
+            table_buffer.append(line)
+            continue
+        if table_buffer:
+            yield tuple(table_buffer)
+            table_buffer = []
+        if line:
+            yield line
+    if table_buffer:
+        yield tuple(table_buffer)
+
+def block_xml(block):
+    if isinstance(block, tuple):
+        return table_xml(block)
+
+    line = block
+    if line.startswith('#'):
+        clean_text = line.lstrip('#').replace('*', '').strip()
+        jc = 'right' if is_arabic(line) else 'left'
+        return heading_xml(clean_text, "Heading1", jc, 28)
+    if line.startswith('* ') or line.startswith('- '):
+        clean_text = line.lstrip('* ').lstrip('- ').strip()
+        return markdown_paragraph_xml(clean_text, style="ListBullet")
+    return markdown_paragraph_xml(line)
+
+# بعد أي تعديل، الـ blocks اللي ما اتغيرتش بترجع من هنا علطول
+# واللي اتغير بس هو اللي بيتبني من الأول
+_fragment_cache = OrderedDict()
+_fragment_lock = threading.Lock()
+
+def cached_block_xml(block):
+    with _fragment_lock:
+        xml = _fragment_cache.get(block)
+        if xml is not None:
+            _fragment_cache.move_to_end(block)
+            return xml
+    xml = block_xml(block)
+    with _fragment_lock:
+        _fragment_cache[block] = xml
+        while len(_fragment_cache) > FRAGMENT_CACHE_SIZE:
+            _fragment_cache.popitem(last=False)
+    return xml
+
+def iter_body_xml(text_content):
+    for block in iter_blocks(text_content):
+        yield cached_block_xml(block)
+
+def write_docx(fragments, user_title):
+    # document.xml بيتكتب جوه الـ zip على دفعات من غير ما يتجمع كله في الذاكرة
+    bio = io.BytesIO()
+    # compresslevel=1: أسرع بكتير في الضغط والفرق في الحجم بسيط للنصوص
+    with zipfile.ZipFile(bio, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for name, data in STATIC_PARTS:
+            zf.writestr(name, data)
+        with zf.open('word/document.xml', 'w') as out:
+            out.write((DOCUMENT_HEAD + title_xml(user_title)).encode('utf-8'))
+            buffer = []
+            size = 0
+            for fragment in fragments:
+                buffer.append(fragment)
+                size += len(fragment)
+                if size >= 64 * 1024:
+                    out.write("".join(buffer).encode('utf-8'))
+                    buffer = []
+                    size = 0
+            buffer.append(DOCUMENT_TAIL)
+            out.write("".join(buffer).encode('utf-8'))
+    bio.seek(0)
+    return bio
+
+def build_styled_docx(text_content, user_title):
+    return write_docx(iter_body_xml(text_content), user_title)
+
+# ---------------------------------------------------------
+# مقارنة مع المسار القديم (python-docx)
+# ---------------------------------------------------------
+def docx_outline(docx_file):
+    # ملخص للمحتوى والتنسيق: (نوع، ستايل، محاذاة، نص، bold لكل run)
+    # عشان نقارن بيه مخرجات الطريقتين
+    w = f"{{{W_NS}}}"
+    data = docx_file.getvalue() if hasattr(docx_file, 'getvalue') else docx_file
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        root = ET.fromstring(zf.read('word/document.xml'))
+
+    def para(p):
+        style = p.find(f"{w}pPr/{w}pStyle")
+        jc = p.find(f"{w}pPr/{w}jc")
+        runs = []
+        for r in p.findall(f"{w}r"):
+            b = r.find(f"{w}rPr/{w}b")
+            bold = b is not None and b.get(f"{w}val") not in ("0", "false")
+            text = "".join(t.text or "" for t in r.iter(f"{w}t"))
+            # python-docx بيسيب run فاضي في خلايا الجدول (cell.text = "")
+            if text:
+                runs.append((text, bold))
+        return ("p", style.get(f"{w}val") if style is not None else "Normal",
+                jc.get(f"{w}val") if jc is not None else None, tuple(runs))
+
+    outline = []
+    for child in root.find(f"{w}body"):
+        if child.tag == f"{w}p":
+            outline.append(para(child))
+        elif child.tag == f"{w}tbl":
+            rows = tuple(tuple(para(p) for tc in tr.findall(f"{w}tc") for p in tc.findall(f"{w}p"))
+                         for tr in child.findall(f"{w}tr"))
+            outline.append(("tbl", rows))
+    return outline
@@ -0,0 +1,472 @@
+import io
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import google.generativeai as genai
+from azkar import zikr_update
+from common import env_int
+from gemini_scheduler import SCHEDULER, QuotaExhausted
+from metrics import span, submit
+from dedup import dedupe_images, duplicate_note
+from pdf_pages import (image_pdf_chunks, split_pdf, extract_page_ranges, page_runs, pdf_text_pages,
+                       merge_pdfs, pdf_page_total)
+from transcription_cache import cache_key
+from uploads import UploadedBlob
+
+GEMINI_MODEL = 'gemini-flash-latest'
+
+# عدد الملفات اللي بتترفع وتتحلل في نفس الوقت
+GEMINI_WORKERS = env_int("MEDMATE_GEMINI_WORKERS", 8)
+# الملفات الأكبر من كده بتتقسم أجزاء كل جزء بالعدد ده من الصفحات
+AI_CHUNK_PAGES = env_int("MEDMATE_AI_CHUNK_PAGES", 10)
+# عدد مرات إعادة المحاولة لكل جزء فشل لسبب غير الرصيد
+SEGMENT_RETRIES = env_int("MEDMATE_AI_SEGMENT_RETRIES", 2)
+
+# ملفات PDF الصغيرة (سكانر من غير نص) بتتجمع في طلب واحد لحد AI_CHUNK_PAGES صفحة
+AI_BATCH_ENABLED = os.environ.get("MEDMATE_AI_BATCH", "1") != "0"
+# أكبر ملف بيدخل في التجميع، وأقصى عدد ملفات في الطلب الواحد
+AI_BATCH_FILE_PAGES = env_int("MEDMATE_AI_BATCH_FILE_PAGES", 3)
+AI_BATCH_FILES = env_int("MEDMATE_AI_BATCH_FILES", 8)
+
+# الرد بيتقرا أول بأول (stream) عشان النص يبان في المعاينة قبل ما الجزء يخلص
+GEMINI_STREAM = os.environ.get("MEDMATE_GEMINI_STREAM", "1") != "0"
+# أقل وقت بين تحديثين للمعاينة (الـ markdown الطويل تقيل في الرسم)
+PREVIEW_INTERVAL = 1.0
+
+# الانتظار بيبدأ قصير ويتضاعف لحد POLL_MAX_DELAY
+POLL_INITIAL_DELAY = 1.0
+POLL_MAX_DELAY = 8.0
+POLL_TIMEOUT = 120
+
+STAGE_LABELS = {
+    "upload": "📤 رفع",
+    "poll": "⏳ انتظار",
+    "generate": "🧠 تحليل",
+    "retry": "🔁 إعادة",
+}
+
+# ---------------------------------------------------------
+# ملف واحد: رفع -> انتظار -> تحليل
+# ---------------------------------------------------------
+def default_model():
+    return genai.GenerativeModel(GEMINI_MODEL)
+
+def wait_until_active(g_file, timeout=POLL_TIMEOUT):
+    delay = POLL_INITIAL_DELAY
+    deadline = time.monotonic() + timeout
+    while g_file.state.name == "PROCESSING":
+        if time.monotonic() >= deadline:
+            raise TimeoutError("انتهت مهلة معالجة الملف.")
+        time.sleep(delay)
+        delay = min(delay * 2, POLL_MAX_DELAY)
+        g_file = genai.get_file(g_file.name)
+    if g_file.state.name == "FAILED":
+        raise RuntimeError("فشلت معالجة الملف على سيرفر Gemini.")
+    return g_file
+
+def upload_pdf(data):
+    # BytesIO على bytes موجودة مش بينسخها، فالملف بيترفع من الذاكرة من غير ملف مؤقت
+    return genai.upload_file(io.BytesIO(data), mime_type="application/pdf")
+
+def stream_text(response, on_text, generate_span=None):
+    # on_text(النص لحد دلوقتي) مع كل chunk، والـ span بيسجل وقت أول نص (first_text)
+    start = time.perf_counter()
+    text = ""
+    for chunk in response:
+        try:
+            piece = chunk.text
+        except ValueError:
+            # chunk من غير نص (زي آخر واحد فيه finish_reason بس)
+            continue
+        if not text and generate_span is not None:
+            generate_span.set(first_text=time.perf_counter() - start)
+        text += piece
+        on_text(text)
+    # رد فاضي خالص: response.text بيرمي نفس الخطأ اللي كان بيترمي من غير stream
+    return text or response.text
+
+def transcribe_pdf(model, prompt, data, on_stage=None, scheduler=None, retries=SEGMENT_RETRIES, on_text=None):
+    # 429 بيريّح المفتاح ويعيد بمفتاح تاني، أو بنفس المفتاح بعد انتظار لو مفيش غيره
+    # (الملف بيترفع تاني لو المفتاح اتغير لأنه تبعه)،
+    # وأي خطأ تاني بيتعاد بعد انتظار عشوائي لحد retries مرة
+    # on_text(النص لحد دلوقتي): لو موجود الرد بيتقرا stream، ومع كل إعادة بيرجع ""
+    on_stage = on_stage or (lambda stage: None)
+    scheduler = scheduler or SCHEDULER
+    uploaded_with = None
+    attempt = 0
+    while True:
+        generation = scheduler.check()
+        try:
+            if uploaded_with != generation:
+                # الملف بيتحسب مرفوع بس لما يبقى ACTIVE، فلو المعالجة فشلت أو المهلة خلصت الإعادة بترفعه من الأول
+                uploaded_with = None
+                on_stage("upload")
+                with span("ai.upload", bytes=len(data)):
+                    g_file = upload_pdf(data)
+                on_stage("poll")
+                with span("ai.poll"):
+                    g_file = wait_until_active(g_file)
+                uploaded_with = generation
+            with span("ai.rate_limit"):
+                scheduler.throttle()
+            on_stage("generate")
+            with span("ai.generate", bytes=len(data)) as generate:
+                gemini = scheduler.model(model, generation)
+                if on_text is None or not GEMINI_STREAM:
+                    text = gemini.generate_content([prompt, g_file]).text
+                else:
+                    text = stream_text(gemini.generate_content([prompt, g_file], stream=True), on_text, generate)
+            scheduler.report_ok(generation)
+            return text
+        except Exception as e:
+            if on_text is not None:
+                on_text("")
+            if is_quota_error(e):
+                scheduler.report_quota(generation)
+                continue
+            if attempt >= retries:
+                raise
+            on_stage("retry")
+            scheduler.backoff(attempt)
+            attempt += 1
+
+# ---------------------------------------------------------
+# كل الملفات مع بعض
+# ---------------------------------------------------------
+def is_quota_error(error):
+    if isinstance(error, QuotaExhausted):
+        return True
+    error_msg = str(error).lower()
+    return "429" in error_msg or "quota" in error_msg
+
+def _report_stages(status_box, stages):
+    counts = {}
+    for stage in stages:
+        if stage in STAGE_LABELS:
+            counts[stage] = counts.get(stage, 0) + 1
+    done = stages.count("done")
+    summary = " | ".join(f"{STAGE_LABELS[s]} {counts[s]}" for s in STAGE_LABELS if s in counts)
+    prefix = f"🧠 خلص {done} من {len(stages)} جزء"
+    zikr_update(status_box, f"{prefix} ({summary})" if summary else prefix)
+
+def run_gemini_pipeline(model, prompt, documents, status_box=None, progress_bar=None,
+                        max_workers=None, retries=SEGMENT_RETRIES, on_done=None, scheduler=None,
+                        page_counts=None, on_preview=None, prompts=None):
+    # documents: list of PDF bytes، والنتيجة بنفس الترتيب
+    # prompts (اختياري): prompt لكل document بدل prompt الواحد (للطلبات المجمعة)
+    # on_preview(النص): النص اللي وصل من كل الأجزاء بالترتيب، كل PREVIEW_INTERVAL على الأكتر
+    # page_counts (اختياري): عدد صفحات كل جزء للـ metrics
+    # كل ملف بيبدأ التحليل أول ما يبقى ACTIVE من غير ما يستنى الباقيين،
+    # فالوقت الكلي تقريبًا وقت أبطأ ملف مش مجموعهم
+    # لو رصيد كل المفاتيح خلص الأجزاء اللي ما خلصتش بترجع None والباقي بيفضل زي ما هو
+    total = len(documents)
+    if not total:
+        return []
+
+    stages = ["queued"] * total
+    results = [None] * total
+    partials = [""] * total
+
+    def work(idx, data):
+        def on_stage(stage):
+            stages[idx] = stage
+
+        def on_text(text):
+            partials[idx] = text
+
+        pages = page_counts[idx] if page_counts else 0
+        with span("ai.segment", pages=pages, bytes=len(data)):
+            text = transcribe_pdf(model, prompts[idx] if prompts else prompt, data, on_stage, scheduler, retries,
+                                  on_text if on_preview is not None else None)
+        stages[idx] = "done"
+        return text
+
+    shown = ""
+    last_preview = 0.0
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers or GEMINI_WORKERS, total)))
+    try:
+        futures = {submit(pool, work, idx, data): idx for idx, data in enumerate(documents)}
+        pending = set(futures)
+        while pending:
+            # التحديث من الـ thread الأساسي بس، كل ثانية أو لما جزء يخلص
+            done, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in done:
+                idx = futures[future]
+                try:
+                    results[idx] = future.result()
+                except QuotaExhausted:
+                    stages[idx] = "quota"
+                    continue
+                if on_done is not None:
+                    on_done(idx)
+            if status_box is not None:
+                _report_stages(status_box, stages)
+            if progress_bar is not None:
+                progress_bar.progress(stages.count("done") / total)
+            if on_preview is not None and time.monotonic() - last_preview >= PREVIEW_INTERVAL:
+                preview = "\n\n".join(text for text in partials if text)
+                if preview != shown:
+                    shown = preview
+                    last_preview = time.monotonic()
+                    on_preview(preview)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return results
+
+# علامة قبل الأجزاء اللي اتحولت بـ OCR بدل الذكاء الاصطناعي
+OCR_FALLBACK_NOTE = "\n\n⚠️ (الجزء ده اتحول بـ OCR لأن رصيد الذكاء الاصطناعي خلص)\n"
+
+# ---------------------------------------------------------
+# طلب واحد لكذا ملف صغير: الملفات بتتدمج في PDF واحد والرد بيتقسم بعلامة قبل كل ملف
+# ---------------------------------------------------------
+BATCH_MARKER_RE = re.compile(r"^[ \t>*#]*=+\s*FILE\s+(\d+)\s*=+[ \t*]*$", re.MULTILINE)
+
+def batch_prompt(prompt, files):
+    # files: [(الاسم، عدد الصفحات)] بالترتيب اللي اتدمجوا بيه
+    lines = []
+    page = 1
+    for number, (name, pages) in enumerate(files, 1):
+        lines.append(f"    - FILE {number}: pages {page}-{page + pages - 1} ({name})")
+        page += pages
+    return (prompt
+            + f"\n    The attached PDF contains {len(files)} separate files merged together:\n"
+            + "\n".join(lines)
+            + "\n    Transcribe each file separately and in order. Start each file with its marker line,"
+            + "\n    exactly as written and alone on its own line, e.g. ===== FILE 1 ====="
+            + "\n    Do not write anything before the first marker.\n")
+
+def split_batch_response(text, count):
+    # بيرجع list بنص كل ملف، أو None لو العلامات ناقصة أو مش بالترتيب
+    matches = list(BATCH_MARKER_RE.finditer(text))
+    if [int(match.group(1)) for match in matches] != list(range(1, count + 1)):
+        return None
+    ends = [match.start() for match in matches[1:]] + [len(text)]
+    parts = [text[match.end():end].strip("\n") + "\n" for match, end in zip(matches, ends)]
+    preamble = text[:matches[0].start()].strip()
+    if preamble:
+        parts[0] = preamble + "\n\n" + parts[0]
+    return parts
+
+def pack_batches(small_files, max_pages, max_files):
+    # small_files: [(أي حاجة، عدد الصفحات)] بالترتيب، وبيرجع مجموعات متتالية تحت الحدين
+    groups = []
+    pages = 0
+    for item in small_files:
+        if not groups or pages + item[1] > max_pages or len(groups[-1]) >= max_files:
+            groups.append([])
+            pages = 0
+        groups[-1].append(item)
+        pages += item[1]
+    return groups
+
+def process_with_ai(image_files, pdf_files, prompt, is_handwritten, status_box,
+                    progress_bar=None, cache=None, max_workers=None, chunk_pages=None, on_file=None,
+                    ocr_fallback=None, on_preview=None):
+    # الصور بتتدمج في PDF واحد من غير عنوان، وبعدها كل PDF بعنوان Source: الخاص بيه
+    # أي ملف أكبر من chunk_pages بيتقسم أجزاء بتتحلل بالتوازي وتترجع بعلامات الصفحات
+    # on_file(name) بيتنادى لما كل أجزاء الملف تخلص (الصور المدموجة بتتبلغ باسم كل صورة)
+    # ocr_fallback(files) -> نص: لو الرصيد خلص في النص، الأجزاء اللي ما خلصتش بس
+    # بتروح للـ OCR واللي خلص بالذكاء الاصطناعي بيفضل زي ما هو
+    # صفحات الـ PDF اللي فيها نص (PowerPoint مثلًا) بتتاخد زي ما هي، والصفحات الصور بس اللي بتترفع
+    # ملفات الـ PDF الصغيرة بتتجمع كذا ملف في طلب واحد (AI_BATCH_*) والرد بيتقسم تاني على الملفات
+    model = default_model()
+    mode = f"ai:{GEMINI_MODEL}"
+    chunk_pages = chunk_pages or AI_CHUNK_PAGES
+
+    # كل جزء: (العنوان، النص لو موجود في الكاش، مفتاح الكاش، [(أول صفحة، آخر صفحة، رقم الطلب)])
+    segments = []
+    documents = []
+    prompts = []
+    page_counts = []
+    cache_hits = 0
+    # لكل طلب: أرقام الملفات بتاعته والملفات اللي بتروح للـ OCR لو الرصيد خلص،
+    # ولكل ملف: الأسماء وعدد الطلبات الباقية
+    owners = []
+    fallback_files = []
+    names = []
+    remaining = []
+
+    def file_done(file_names):
+        if on_file is not None:
+            for name in file_names:
+                on_file(name)
+
+    def new_owner(file_names):
+        names.append(file_names)
+        remaining.append(0)
+        return len(names) - 1
+
+    def finish_owner(owner):
+        # لو كل أجزاء الملف رجعت من الكاش أو من النص اللي جوه الـ PDF
+        if not remaining[owner]:
+            file_done(names[owner])
+
+    def request(data, pages, request_owners, fallback, request_prompt=None):
+        documents.append(data)
+        prompts.append(request_prompt or prompt)
+        page_counts.append(pages)
+        fallback_files.append(fallback)
+        owners.append(request_owners)
+        return len(documents) - 1
+
+    # الملفات الصغيرة بتستنى لحد آخر اللفة عشان تتجمع: (رقم الجزء، الملف، عدد الصفحات، رقم الملف)
+    small_files = []
+    # رقم الجزء -> (رقم الطلب المجمع، ترتيب الملف جواه)
+    batched = {}
+
+    def add(header, key, load, owner, fallback_for, first_page=1, small_pages=None, pdf=None):
+        # load() بيرجع أجزاء [(أول صفحة، آخر صفحة، bytes)]، وfirst_page: رقم أول صفحة فيها جوه الملف الأصلي
+        nonlocal cache_hits
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None:
+            cache_hits += 1
+            segments.append((header, cached, key, None))
+            return
+        if small_pages is not None:
+            segments.append((header, None, key, None))
+            small_files.append((len(segments) - 1, pdf, small_pages, owner))
+            remaining[owner] += 1
+            return
+        # أرقام الصفحات جوه الملف الأصلي، للعناوين ولاسم جزء الـ OCR لو الرصيد خلص
+        parts = []
+        for first, last, data in load():
+            pages = last - first + 1 if last else 0
+            first, last = first + first_page - 1, last and last + first_page - 1
+            parts.append((first, last, request(data, pages, [owner], fallback_for(first, last, data))))
+        segments.append((header, None, key, parts))
+        remaining[owner] += len(parts)
+
+    def on_done(idx):
+        for owner in owners[idx]:
+            remaining[owner] -= 1
+            if not remaining[owner]:
+                file_done(names[owner])
+
+    def split(data):
+        with span("ai.split", bytes=len(data)):
+            return split_pdf(data, chunk_pages)
+
+    if image_files:
+        def merge_images():
+            # كل جزء بيتعمل PDF لوحده علطول بدل ملف واحد كبير يتقسم بعدين
+            zikr_update(status_box, "📦 جاري دمج الصور")
+            return image_pdf_chunks(image_files, chunk_pages)
+
+        def image_fallback(first, last, data):
+            # كل صورة صفحة في الـ PDF المدموج، فالـ OCR بيشتغل على الصور نفسها
+            return [UploadedBlob(f.name, f.type, f.getvalue()) for f in image_files[first - 1:last]]
+
+        # الصور المكررة ما بتترفعش، بس بيتكتب مكانها ملاحظة بعد نص الصور واسمها بيتبلغ مع باقي الصور لما تخلص
+        owner = new_owner([f.name for f in image_files])
+        image_files, duplicates = dedupe_images(image_files)
+        add("", cache_key([f.getvalue() for f in image_files], mode, prompt, is_handwritten),
+            merge_images, owner, image_fallback)
+        if duplicates:
+            segments.append(("", "".join(f"\n\n--- محتوى الصورة: {name} ---\n" + duplicate_note(original)
+                                         for name, original in duplicates), None, None))
+        finish_owner(owner)
+
+    for pdf in pdf_files:
+        def pdf_fallback(first, last, data, name=pdf.name):
+            label = name if last is None else f"{name} (صفحات {first}-{last})"
+            return [UploadedBlob(label, "application/pdf", data)]
+
+        owner = new_owner([pdf.name])
+        header = f"\n\nSource: {pdf.name}\n"
+        text_pages = pdf_text_pages(pdf.getvalue())
+        if not text_pages or not any(text_pages):
+            pages = len(text_pages) if text_pages else pdf_page_total(pdf.getvalue())
+            small = AI_BATCH_ENABLED and pages is not None and pages <= min(AI_BATCH_FILE_PAGES, chunk_pages)
+            # الرقم ده نفس مفتاح الملف لو اتبعت لوحده، فالكاش بينفع في الحالتين
+            add(header, cache_key(pdf.getvalue(), mode, prompt, is_handwritten),
+                lambda: split(pdf.getvalue()), owner, pdf_fallback,
+                small_pages=pages if small else None, pdf=pdf)
+            finish_owner(owner)
+            continue
+
+        # صفحات النص بترجع علطول، وكل مجموعة صفحات صور متتالية بتروح لـ Gemini لوحدها
+        runs = page_runs([page_no for page_no, text in enumerate(text_pages, 1) if text is None], chunk_pages)
+        run_data = dict(zip(runs, extract_page_ranges(pdf.getvalue(), runs)))
+        page_no = 1
+        for first, last in runs + [(len(text_pages) + 1, None)]:
+            text = "".join(f"\n\n--- صفحة {p} ---\n{text_pages[p - 1]}\n" for p in range(page_no, first))
+            if text:
+                segments.append((header, text, None, None))
+                header = ""
+            if last is None:
+                break
+            label = f"صفحة {first}" if first == last else f"صفحات {first}-{last}"
+            add(f"{header}\n\n--- {label} ---\n",
+                cache_key(pdf.getvalue(), f"{mode}:pages:{first}-{last}", prompt, is_handwritten),
+                lambda data=run_data[(first, last)]: split(data), owner, pdf_fallback, first)
+            header = ""
+            page_no = last + 1
+        finish_owner(owner)
+
+    # الطلبات المجمعة: الملف اللي لوحده بيتبعت بالـ prompt العادي
+    batches = {}
+    for group in pack_batches([(item, item[2]) for item in small_files], chunk_pages, AI_BATCH_FILES):
+        members = [item for item, _ in group]
+        if len(members) == 1:
+            data = members[0][1].getvalue()
+            request_prompt = None
+        else:
+            with span("ai.batch_merge", pages=sum(item[2] for item in members), files=len(members)):
+                data = merge_pdfs([item[1].getvalue() for item in members])
+            request_prompt = batch_prompt(prompt, [(item[1].name, item[2]) for item in members])
+        idx = request(data, sum(item[2] for item in members), [item[3] for item in members],
+                      [UploadedBlob(item[1].name, "application/pdf", item[1].getvalue()) for item in members],
+                      request_prompt)
+        batches[idx] = len(members)
+        for position, item in enumerate(members):
+            batched[item[0]] = (idx, position)
+
+    results = run_gemini_pipeline(model, prompt, documents, status_box, progress_bar, max_workers,
+                                  on_done=on_done, page_counts=page_counts, on_preview=on_preview,
+                                  prompts=prompts)
+
+    missing = [idx for idx, text in enumerate(results) if text is None]
+    if missing and ocr_fallback is None:
+        raise QuotaExhausted("🛑 رصيد Gemini خلص (quota).")
+    for idx in missing:
+        zikr_update(status_box, f"📄 رصيد الذكاء الاصطناعي خلص.. {len(missing)} جزء هيتحول بـ OCR")
+        with span("ai.ocr_fallback", pages=page_counts[idx]):
+            if idx in batches:
+                # الطلب المجمع بيرجع للـ OCR ملف ملف عشان كل ملف يفضل تحت عنوانه
+                results[idx] = [OCR_FALLBACK_NOTE + ocr_fallback([f]) for f in fallback_files[idx]]
+            else:
+                results[idx] = OCR_FALLBACK_NOTE + ocr_fallback(fallback_files[idx])
+        on_done(idx)
+
+    # الرد المجمع بيتقسم على الملفات، ولو العلامات مش مظبوطة الرد كله بيتحط تحت أول ملف
+    unsplit = set()
+    for idx, count in batches.items():
+        if idx in missing:
+            continue
+        texts = [results[idx]] if count == 1 else split_batch_response(results[idx], count)
+        if texts is None:
+            unsplit.add(idx)
+            first_name = fallback_files[idx][0].name
+            texts = [results[idx]] + [f"\n(نص الملف ده جه مع {first_name} فوق)\n"] * (count - 1)
+        results[idx] = texts
+
+    final_content = ""
+    for seg_no, (header, text, key, parts) in enumerate(segments):
+        if text is None:
+            if seg_no in batched:
+                idx, position = batched[seg_no]
+                indices = [idx]
+                text = results[idx][position]
+            else:
+                indices = [idx for _, _, idx in parts]
+                if len(parts) == 1:
+                    text = results[indices[0]]
+                else:
+                    text = "".join(f"\n\n--- صفحات {first}-{last} ---\n" + results[idx]
+                                   for first, last, idx in parts)
+            # الملفات اللي جزء منها اتحول بـ OCR أو ردها ما اتقسمش ما تتحفظش في كاش الذكاء الاصطناعي
+            if cache is not None and not any(idx in missing or idx in unsplit for idx in indices):
+                cache.put(key, text)
+        final_content += header + text
+    return final_content, cache_hits
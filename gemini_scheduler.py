@@ -0,0 +1,171 @@
+import random
+import threading
+import time
+import google.generativeai as genai
+from common import env_int, env_float
+
+# أقصى عدد طلبات generate_content في الدقيقة للمفتاح الواحد (0 = من غير حد)
+GEMINI_RPM = env_float("MEDMATE_GEMINI_RPM", 10)
+# عدد العمليات اللي بتستخدم نفس المفاتيح في نفس الوقت (jobs.ensure_workers و batch.py بيحطوه)،
+# فكل عملية بتاخد نصيبها من GEMINI_RPM بدل ما كل واحدة تبعت الحد كله
+GEMINI_PROCESSES = env_int("MEDMATE_GEMINI_PROCESSES", 1)
+# بعد 429 المفتاح بيستريح QUOTA_BACKOFF ثانية (عشوائي حواليها)، وبتتضاعف مع كل 429 ورا بعض لحد KEY_COOLDOWN
+KEY_COOLDOWN = env_float("MEDMATE_GEMINI_KEY_COOLDOWN", 60)
+QUOTA_BACKOFF = 5.0
+# عدد مرات الـ 429 ورا بعض (من غير ولا طلب ناجح) اللي بعدها المفتاح بيتحسب رصيده خلص فعلًا
+# (حد الدقيقة بيعدي في الانتظار ده، 5+10+20+40 ثانية تقريبًا)
+QUOTA_STRIKES = 4
+
+# إعادة المحاولة: انتظار عشوائي بين 0 والحد ده، والحد بيتضاعف لحد BACKOFF_MAX
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+class QuotaExhausted(RuntimeError):
+    pass
+
+def parse_api_keys(value):
+    # st.secrets ممكن يديها list أو string مفصول بفواصل
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [key.strip() for key in value if key and key.strip()]
+
+# ---------------------------------------------------------
+# Token bucket: الطلبات بتستنى دورها بدل ما تضرب 429
+# ---------------------------------------------------------
+class TokenBucket:
+    def __init__(self, per_minute, burst=None):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, float(burst or min(per_minute, 5) or 1))
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        with self.lock:
+            self.tokens = self.capacity
+            self.stamp = time.monotonic()
+
+    def take(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+# ---------------------------------------------------------
+# مجموعة مفاتيح: لما رصيد مفتاح يخلص بنكمل بالمفتاح اللي بعده
+# ---------------------------------------------------------
+class GeminiScheduler:
+    def __init__(self, per_minute=GEMINI_RPM / GEMINI_PROCESSES, cooldown=KEY_COOLDOWN):
+        self.bucket = TokenBucket(per_minute)
+        self.cooldown = cooldown
+        self.keys = []
+        self.current = 0
+        # بيزيد مع كل تبديل مفتاح، والملفات المرفوعة بمفتاح قديم لازم تترفع تاني
+        self.generation = 0
+        # رقم المفتاح -> لحد إمتى مستريح، وعدد مرات الـ 429 ورا بعض
+        self.resting = {}
+        self.strikes = {}
+        self.models = {}
+        self.lock = threading.Lock()
+
+    def set_keys(self, keys):
+        keys = list(dict.fromkeys(parse_api_keys(keys)))
+        with self.lock:
+            if keys == self.keys:
+                return
+            self.keys = keys
+            self.current = 0
+            self.resting = {}
+            self.strikes = {}
+            self._switch()
+
+    def _switch(self):
+        self.generation += 1
+        self.models = {}
+        self.bucket.refill()
+        if self.keys:
+            genai.configure(api_key=self.keys[self.current])
+
+    def check(self):
+        # بيرجع generation الحالي، ولو كل المفاتيح مستريحة بيستنى أقربها يرجع،
+        # وبيرمي QuotaExhausted بس لو كلهم خدوا QUOTA_STRIKES مرة 429 ورا بعض
+        while True:
+            with self.lock:
+                wait = self._next_key()
+                if wait is None:
+                    return self.generation
+            time.sleep(wait)
+
+    def _next_key(self):
+        # None لو فيه مفتاح جاهز، أو المدة لحد ما أول مفتاح يخلص راحته
+        # المفتاح اللي رصيده خلص بيرجع يتجرب من الأول بعد KEY_COOLDOWN (للتحويلات الجاية)
+        now = time.monotonic()
+        for key_idx, until in list(self.resting.items()):
+            if until <= now:
+                del self.resting[key_idx]
+                if self.strikes.get(key_idx, 0) >= QUOTA_STRIKES:
+                    del self.strikes[key_idx]
+        # من غير مفاتيح (genai.configure من برة) بنعامل المفتاح الحالي كأنه الوحيد
+        count = max(1, len(self.keys))
+        for step in range(count):
+            candidate = (self.current + step) % count
+            if candidate not in self.resting:
+                if candidate != self.current:
+                    self.current = candidate
+                    self._switch()
+                return None
+        if all(self.strikes.get(key_idx, 0) >= QUOTA_STRIKES for key_idx in range(count)):
+            raise QuotaExhausted("🛑 رصيد Gemini خلص لكل المفاتيح (quota).")
+        return max(0.0, min(until for key_idx, until in self.resting.items()
+                            if self.strikes.get(key_idx, 0) < QUOTA_STRIKES) - now)
+
+    def report_quota(self, generation):
+        # الطلبات اللي فشلت مع نفس المفتاح بتريّحه مرة واحدة بس، والمفتاح اللي بعده بيتختار في check
+        with self.lock:
+            # الـ threads اللي كانت باعتة مع بعض بتاخد 429 مع بعض، فبتتحسب مرة واحدة بس
+            if generation != self.generation or self.current in self.resting:
+                return
+            strikes = self.strikes.get(self.current, 0) + 1
+            self.strikes[self.current] = strikes
+            rest = self.cooldown
+            if strikes < QUOTA_STRIKES:
+                rest = random.uniform(0.5, 1.0) * min(self.cooldown, QUOTA_BACKOFF * 2 ** (strikes - 1))
+            self.resting[self.current] = time.monotonic() + rest
+
+    def report_ok(self, generation):
+        # طلب نجح: الـ 429 اللي قبله كان حد الدقيقة مش الرصيد
+        with self.lock:
+            if generation == self.generation:
+                self.strikes.pop(self.current, None)
+
+    def throttle(self):
+        self.bucket.take()
+
+    def model(self, model, generation):
+        # الـ model بيحتفظ بالـ client بتاع أول مفتاح استخدمه،
+        # فبنعمل نسخة جديدة لكل مفتاح (إنشاؤها رخيص ومن غير أي request)
+        name = getattr(model, "model_name", model)
+        with self.lock:
+            if generation != self.generation:
+                return genai.GenerativeModel(name)
+            if name not in self.models:
+                self.models[name] = genai.GenerativeModel(name)
+            return self.models[name]
+
+    def backoff(self, attempt):
+        time.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
+
+SCHEDULER = GeminiScheduler()
+
+def set_api_keys(keys):
+    SCHEDULER.set_keys(keys)
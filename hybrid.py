@@ -0,0 +1,166 @@
+from PIL import Image
+from azkar import zikr_update
+from common import env_float
+from pdf_pages import extract_page_ranges, split_pdf, convert_images_to_pdf, page_runs, PdfReader
+from ocr_engine import ocr_stream, count_ocr_pages, iter_pdf_page_items
+from gemini_pipeline import GEMINI_MODEL, AI_CHUNK_PAGES, OCR_FALLBACK_NOTE, default_model, run_gemini_pipeline
+from transcription_cache import cache_key
+from metrics import span
+from dedup import PageDeduper, dedupe_items
+
+# أقل متوسط ثقة (0-100) عشان الصفحة تفضل OCR ومتروحش للذكاء الاصطناعي
+HYBRID_MIN_CONF = env_float("MEDMATE_HYBRID_MIN_CONF", 75)
+# لو الطالب قال إن فيه خط يد بنبقى أشد، فالصفحات المطبوعة الواضحة جدًا بس اللي بتفضل OCR
+HYBRID_MIN_CONF_HANDWRITTEN = env_float("MEDMATE_HYBRID_MIN_CONF_HANDWRITTEN", 90)
+
+# ---------------------------------------------------------
+# الخطوة الأولى: OCR لكل صفحة مع الثقة
+# ---------------------------------------------------------
+def iter_hybrid_items(files, status_box, dpi=None, text_groups=None):
+    # group لكل صفحة: (رقم الملف، رقم الصفحة)، وملفات PDF من غير pdf2image ولا نص بتروح كلها للذكاء الاصطناعي
+    # الصفحات اللي نصها موجود جوه الـ PDF بتتسجل في text_groups ومش بتحتاج لا OCR ولا AI
+    for idx, f in enumerate(files):
+        zikr_update(status_box, "🔎 جاري فحص الصفحات (OCR)")
+        if f.type == "application/pdf":
+            for page_no, header, text, page in iter_pdf_page_items(f, dpi):
+                if page is not None:
+                    yield ((idx, page_no), header, page)
+                    continue
+                if text is not None and text_groups is not None:
+                    text_groups.add((idx, page_no))
+                # صفحة من غير نص ولا صورة: نصها فاضي وثقتها مش معروفة فبتروح للذكاء الاصطناعي
+                yield ((idx, page_no), header + (text or ""))
+        else:
+            yield ((idx, 1), f"\n\n--- محتوى الصورة: {f.name} ---\n", Image.open(f))
+
+# ---------------------------------------------------------
+# هجين: الصفحات الواضحة من Tesseract والباقي من Gemini بنفس ترتيب الصفحات
+# ---------------------------------------------------------
+def process_hybrid(files, prompt, is_handwritten, status_box, progress_bar=None, cache=None,
+                   max_workers=None, preprocess=False, dpi=None, on_file=None, min_confidence=None,
+                   on_preview=None):
+    if min_confidence is None:
+        min_confidence = HYBRID_MIN_CONF_HANDWRITTEN if is_handwritten else HYBRID_MIN_CONF
+    mode = f"ai:{GEMINI_MODEL}"
+
+    total = count_ocr_pages(files)
+    # الصفحات المكررة بتتعامل زي صفحات النص: ملاحظة بس ومش بتروح لا OCR ولا AI
+    text_groups = set()
+    items = dedupe_items(iter_hybrid_items(files, status_box, dpi, text_groups), PageDeduper(), text_groups)
+    with span("hybrid.ocr", pages=total):
+        texts, confidences = ocr_stream(items, status_box, max_workers, total, preprocess, confidence=True)
+
+    def confident(group):
+        if group in text_groups:
+            return True
+        conf = confidences.get(group)
+        return conf is not None and conf >= min_confidence
+
+    # pieces بالترتيب: نص OCR جاهز، أو رقم طلب Gemini
+    pieces = []
+    documents = []
+    ai_requests = []
+    remaining = [0] * len(files)
+    cache_hits = 0
+    ai_pages = 0
+
+    def add_ai(owners, header, fallback, key, load, pages):
+        nonlocal cache_hits, ai_pages
+        ai_pages += pages
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None:
+            cache_hits += 1
+            pieces.append(header + cached)
+            return
+        pieces.append(len(ai_requests))
+        ai_requests.append({"owners": owners, "header": header, "fallback": fallback, "key": key})
+        documents.append(load())
+        for owner in owners:
+            remaining[owner] += 1
+
+    image_run = []
+
+    def flush_images():
+        if not image_run:
+            return
+        run_files = [files[idx] for idx in image_run]
+        add_ai(list(image_run),
+               f"\n\n--- محتوى الصور: {'، '.join(f.name for f in run_files)} (AI) ---\n",
+               "".join(texts.get((idx, 1), "") for idx in image_run),
+               cache_key([f.getvalue() for f in run_files], mode, prompt, is_handwritten),
+               lambda: convert_images_to_pdf(run_files).getvalue(),
+               len(run_files))
+        image_run.clear()
+
+    for idx, f in enumerate(files):
+        if f.type != "application/pdf":
+            if confident((idx, 1)):
+                flush_images()
+                pieces.append(texts.get((idx, 1), ""))
+            else:
+                image_run.append(idx)
+                if len(image_run) >= AI_CHUNK_PAGES:
+                    flush_images()
+            continue
+        flush_images()
+
+        pages = sorted(page_no for file_idx, page_no in texts if file_idx == idx)
+        low = [page_no for page_no in pages if not confident((idx, page_no))]
+        if not pages or (low and PdfReader is None):
+            # ما اتعملهاش OCR أو مش هنقدر نقص صفحات منها: الملف كله للذكاء الاصطناعي
+            for first, last, data in split_pdf(f.getvalue(), AI_CHUNK_PAGES):
+                fallback = "".join(texts.get((idx, page_no), "") for page_no in pages
+                                   if first <= page_no <= (last or page_no))
+                header = f"\n\n--- صفحات {first}-{last} من {f.name} (AI) ---\n" if last else f"\n\nSource: {f.name}\n"
+                add_ai([idx], header, fallback, cache_key(f.getvalue(), f"{mode}:pages:{first}-{last}", prompt, is_handwritten),
+                       lambda data=data: data, last - first + 1 if last else max(1, len(pages)))
+            continue
+
+        runs = page_runs(low, AI_CHUNK_PAGES)
+        run_data = dict(zip(runs, extract_page_ranges(f.getvalue(), runs))) if runs else {}
+        page_no = pages[0]
+        for first, last in runs + [(pages[-1] + 1, None)]:
+            pieces.extend(texts.get((idx, p), "") for p in pages if page_no <= p < first)
+            if last is None:
+                break
+            label = f"صفحة {first}" if first == last else f"صفحات {first}-{last}"
+            add_ai([idx], f"\n\n--- {label} من {f.name} (AI) ---\n",
+                   "".join(texts.get((idx, p), "") for p in range(first, last + 1)),
+                   cache_key(f.getvalue(), f"{mode}:pages:{first}-{last}", prompt, is_handwritten),
+                   lambda data=run_data[(first, last)]: data, last - first + 1)
+            page_no = last + 1
+    flush_images()
+
+    # الملفات اللي خلصت كلها من الـ OCR أو الكاش
+    if on_file is not None:
+        for idx, f in enumerate(files):
+            if not remaining[idx]:
+                on_file(f.name)
+
+    def on_done(request_idx):
+        for owner in ai_requests[request_idx]["owners"]:
+            remaining[owner] -= 1
+            if not remaining[owner] and on_file is not None:
+                on_file(files[owner].name)
+
+    zikr_update(status_box, f"🧠 {ai_pages} صفحة من {max(len(texts), ai_pages)} محتاجة الذكاء الاصطناعي")
+    with span("hybrid.ai", pages=ai_pages, requests=len(documents)):
+        results = run_gemini_pipeline(default_model(), prompt, documents, status_box, progress_bar,
+                                      on_done=on_done, on_preview=on_preview)
+
+    final_content = ""
+    for piece in pieces:
+        if isinstance(piece, str):
+            final_content += piece
+            continue
+        request = ai_requests[piece]
+        text = results[piece]
+        if text is None:
+            # الرصيد خلص: نص الـ OCR بتاع نفس الصفحات موجود أصلًا
+            final_content += OCR_FALLBACK_NOTE + request["fallback"]
+            on_done(piece)
+            continue
+        if cache is not None:
+            cache.put(request["key"], text)
+        final_content += request["header"] + text
+    return final_content, cache_hits
@@ -0,0 +1,315 @@
+import json
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from common import env_int
+from uploads import UploadedBlob
+
+JOBS_DIR = os.environ.get("MEDMATE_JOBS_DIR") or os.path.join(tempfile.gettempdir(), "medmate_jobs")
+os.makedirs(JOBS_DIR, exist_ok=True)
+DB_PATH = os.path.join(JOBS_DIR, "jobs.sqlite3")
+
+# لو الـ job ما بعتتش heartbeat المدة دي يبقى الـ worker بتاعها مات، فبترجع للطابور
+STALE_SECONDS = 60
+HEARTBEAT_SECONDS = 5
+MAX_ATTEMPTS = 3
+# الـ jobs الخلصانة بتتمسح هي وملفاتها بعد المدة دي
+JOB_RETENTION = env_int("MEDMATE_JOB_RETENTION_HOURS", 72, minimum=0) * 3600
+# أقل مدة بين كل كتابة لحالة الـ job في الداتابيز
+STATUS_INTERVAL = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    files TEXT NOT NULL,
+    message TEXT NOT NULL DEFAULT '',
+    progress REAL NOT NULL DEFAULT 0,
+    file_status TEXT NOT NULL DEFAULT '{}',
+    result TEXT,
+    cache_hits INTEGER NOT NULL DEFAULT 0,
+    timings TEXT,
+    partial TEXT,
+    error TEXT,
+    error_kind TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    heartbeat REAL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+CREATE TABLE IF NOT EXISTS workers (
+    pid INTEGER PRIMARY KEY,
+    seen REAL NOT NULL
+);
+"""
+
+# ---------------------------------------------------------
+# الداتابيز
+# ---------------------------------------------------------
+_schema_ready = False
+
+@contextmanager
+def connect():
+    global _schema_ready
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    try:
+        conn.row_factory = sqlite3.Row
+        if not _schema_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            _migrate(conn)
+            _schema_ready = True
+        yield conn
+    finally:
+        conn.close()
+
+def _migrate(conn):
+    # أعمدة اتضافت بعد أول نسخة من الداتابيز
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+    if "timings" not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN timings TEXT")
+    if "partial" not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN partial TEXT")
+
+def _update(job_id, **fields):
+    fields["updated"] = time.time()
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    with connect() as conn:
+        conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+def _row_to_job(row):
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    job["files"] = json.loads(job["files"])
+    job["file_status"] = json.loads(job["file_status"])
+    job["timings"] = json.loads(job["timings"]) if job["timings"] else []
+    return job
+
+# ---------------------------------------------------------
+# من ناحية الـ UI
+# ---------------------------------------------------------
+def _safe_name(name):
+    return re.sub(r"[^\w.\-]+", "_", name)[:100] or "file"
+
+def submit_job(files, params):
+    # الملفات بتتحفظ على الديسك عشان الـ job تعيش بعد أي refresh أو restart
+    job_id = uuid.uuid4().hex
+    job_dir = os.path.join(JOBS_DIR, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+
+    stored = []
+    for idx, f in enumerate(files):
+        path = os.path.join(job_dir, f"{idx}_{_safe_name(f.name)}")
+        with open(path, "wb") as out:
+            out.write(f.getvalue())
+        stored.append({"name": f.name, "type": f.type, "path": path})
+
+    now = time.time()
+    with connect() as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, status, params, files, file_status, created, updated) "
+            "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+            (job_id, json.dumps(params, ensure_ascii=False), json.dumps(stored, ensure_ascii=False),
+             json.dumps({f["name"]: "queued" for f in stored}, ensure_ascii=False), now, now),
+        )
+    return job_id
+
+def resubmit_job(job_id, params):
+    # نفس الملفات المتخزنة بإعدادات مختلفة (زي الرجوع للـ OCR لما الرصيد يخلص)
+    job = get_job(job_id)
+    if job is None:
+        return None
+    return submit_job(load_files(job), params)
+
+def get_job(job_id):
+    with connect() as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _row_to_job(row) if row else None
+
+def load_files(job):
+    files = []
+    for f in job["files"]:
+        with open(f["path"], "rb") as data:
+            files.append(UploadedBlob(f["name"], f["type"], data.read()))
+    return files
+
+# ---------------------------------------------------------
+# تشغيل الـ workers
+# ---------------------------------------------------------
+_spawned = []
+_spawn_lock = threading.Lock()
+
+def live_workers():
+    with connect() as conn:
+        return conn.execute("SELECT COUNT(*) FROM workers WHERE seen > ?",
+                            (time.time() - STALE_SECONDS,)).fetchone()[0]
+
+def ensure_workers(count, api_keys=None):
+    # الـ workers عمليات منفصلة، فلو الـ UI عمل restart هي بتكمل شغل،
+    # وبنعدّهم من الداتابيز عشان ما نشغلش أكتر من المطلوب
+    with _spawn_lock:
+        _spawned[:] = [proc for proc in _spawned if proc.poll() is None]
+        missing = count - max(live_workers(), len(_spawned))
+        if missing <= 0:
+            return
+
+        env = dict(os.environ)
+        if api_keys:
+            env["GEMINI_API_KEYS"] = ",".join(api_keys)
+        # الأنوية بتتقسم على الـ workers بدل ما كل واحد ياخدهم كلهم
+        env.setdefault("MEDMATE_OCR_WORKERS", str(max(1, (os.cpu_count() or 1) // count)))
+        # ونفس الكلام لحد طلبات Gemini في الدقيقة، لأنهم كلهم على نفس المفاتيح
+        env.setdefault("MEDMATE_GEMINI_PROCESSES", str(count))
+        here = os.path.dirname(os.path.abspath(__file__))
+        for _ in range(missing):
+            _spawned.append(subprocess.Popen([sys.executable, os.path.join(here, "jobs.py"), "worker"],
+                                             cwd=here, env=env))
+
+# ---------------------------------------------------------
+# من ناحية الـ worker
+# ---------------------------------------------------------
+class JobStatusBox:
+    # بيتعامل كأنه st.empty() و st.progress() بس بيكتب الحالة في الداتابيز
+    def __init__(self, job_id, file_status):
+        self.job_id = job_id
+        self.file_status = dict(file_status)
+        self.message = ""
+        self.fraction = 0.0
+        self.partial = None
+        self.last_write = 0.0
+
+    def _flush(self, force=False):
+        now = time.time()
+        if force or now - self.last_write >= STATUS_INTERVAL:
+            self.last_write = now
+            fields = {}
+            if self.partial is not None:
+                # النص بيتكتب لما يتغير بس، مش مع كل تحديث للرسالة
+                fields["partial"] = self.partial
+                self.partial = None
+            _update(self.job_id, message=self.message, progress=self.fraction, heartbeat=now,
+                    file_status=json.dumps(self.file_status, ensure_ascii=False), **fields)
+
+    def markdown(self, text):
+        self.message = text
+        self._flush()
+
+    def progress(self, fraction):
+        self.fraction = fraction
+        self._flush()
+
+    def preview(self, text):
+        self.partial = text
+        self._flush()
+
+    def file_done(self, name):
+        self.file_status[name] = "done"
+        done = sum(1 for state in self.file_status.values() if state == "done")
+        self.fraction = max(self.fraction, done / max(1, len(self.file_status)))
+        self._flush(force=True)
+
+def claim_job():
+    with connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1").fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        now = time.time()
+        conn.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1, heartbeat = ?, "
+                     "updated = ? WHERE id = ?", (now, now, row["id"]))
+        conn.execute("COMMIT")
+    job = _row_to_job(row)
+    job["attempts"] += 1
+    return job
+
+def requeue_stale():
+    cutoff = time.time() - STALE_SECONDS
+    with connect() as conn:
+        conn.execute("UPDATE jobs SET status = 'failed', error = 'توقف التحويل أكتر من مرة.', "
+                     "updated = ? WHERE status = 'running' AND heartbeat < ? AND attempts >= ?",
+                     (time.time(), cutoff, MAX_ATTEMPTS))
+        conn.execute("UPDATE jobs SET status = 'queued', message = '', partial = NULL, updated = ? "
+                     "WHERE status = 'running' AND heartbeat < ?", (time.time(), cutoff))
+
+def purge_jobs():
+    cutoff = time.time() - JOB_RETENTION
+    with connect() as conn:
+        rows = conn.execute("SELECT id FROM jobs WHERE status IN ('done', 'failed') AND updated < ?",
+                            (cutoff,)).fetchall()
+        for row in rows:
+            shutil.rmtree(os.path.join(JOBS_DIR, row["id"]), ignore_errors=True)
+            conn.execute("DELETE FROM jobs WHERE id = ?", (row["id"],))
+        conn.execute("DELETE FROM workers WHERE seen < ?", (time.time() - STALE_SECONDS,))
+
+def _mark_alive():
+    with connect() as conn:
+        conn.execute("INSERT OR REPLACE INTO workers (pid, seen) VALUES (?, ?)", (os.getpid(), time.time()))
+
+def run_job(job):
+    from converter import run_conversion
+    from gemini_pipeline import is_quota_error
+    from metrics import collect
+
+    box = JobStatusBox(job["id"], job["file_status"])
+    stop = threading.Event()
+
+    def heartbeat():
+        # Gemini ممكن ياخد دقايق من غير أي تحديث للحالة
+        while not stop.wait(HEARTBEAT_SECONDS):
+            _update(job["id"], heartbeat=time.time())
+            _mark_alive()
+
+    beat = threading.Thread(target=heartbeat, daemon=True)
+    beat.start()
+    with collect() as trace:
+        try:
+            text, cache_hits = run_conversion(load_files(job), job["params"], box, box, on_file=box.file_done,
+                                              on_preview=box.preview)
+        except Exception as e:
+            traceback.print_exc()
+            _update(job["id"], status="failed", error=str(e), timings=json.dumps(trace.summary()),
+                    error_kind="quota" if is_quota_error(e) else "error")
+            return
+        finally:
+            stop.set()
+    _update(job["id"], status="done", result=text, cache_hits=cache_hits, progress=1.0,
+            timings=json.dumps(trace.summary()), partial=None,
+            file_status=json.dumps({name: "done" for name in box.file_status}, ensure_ascii=False))
+
+def run_worker(poll_interval=1.0):
+    from gemini_scheduler import parse_api_keys, set_api_keys
+
+    api_keys = parse_api_keys(os.environ.get("GEMINI_API_KEYS")) + parse_api_keys(os.environ.get("GEMINI_API_KEY"))
+    if api_keys:
+        set_api_keys(api_keys)
+
+    last_purge = 0.0
+    while True:
+        _mark_alive()
+        if time.time() - last_purge > 600:
+            purge_jobs()
+            last_purge = time.time()
+        requeue_stale()
+        job = claim_job()
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["worker"]:
+        run_worker()
+    else:
+        print("usage: python jobs.py worker")
@@ -0,0 +1,201 @@
+import atexit
+import bisect
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from common import env_int
+
+METRICS_ENABLED = os.environ.get("MEDMATE_METRICS", "1") != "0"
+METRICS_DIR = os.environ.get("MEDMATE_METRICS_DIR") or os.path.join(tempfile.gettempdir(), "medmate_metrics")
+# كل span بيتكتب سطر JSON هنا، ولما يعدّي SPANS_LOG_MAX_MB بيتنقل لـ spans.jsonl.1
+# (اللي كان هناك بيتمسح)، فاللوج ما بياخدش أكتر من ضعف الحد ده
+SPANS_LOG = os.path.join(METRICS_DIR, "spans.jsonl")
+SPANS_LOG_MAX_MB = env_int("MEDMATE_METRICS_LOG_MB", 50)
+# ملف لكل عملية (الـ UI وكل worker) عشان node_exporter --collector.textfile يقراهم
+PROM_FILE = os.path.join(METRICS_DIR, f"medmate_{os.getpid()}.prom")
+
+# حدود الـ histogram بالثواني (من صفحة OCR لحد ملف Gemini كبير)
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# الـ spans اللي بتتجمع للتحويل الحالي (بيتنسخ للـ threads عن طريق submit)
+_trace = contextvars.ContextVar("medmate_trace", default=None)
+_parent = contextvars.ContextVar("medmate_span", default=None)
+
+# ---------------------------------------------------------
+# Histograms على مستوى العملية كلها
+# ---------------------------------------------------------
+class StageStats:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.pages = 0
+        self.bytes = 0
+
+    def add(self, seconds, pages, size):
+        idx = bisect.bisect_left(BUCKETS, seconds)
+        if idx < len(BUCKETS):
+            self.buckets[idx] += 1
+        self.count += 1
+        self.seconds += seconds
+        self.pages += pages
+        self.bytes += size
+
+_stages = {}
+_lock = threading.Lock()
+
+def _record(record):
+    with _lock:
+        stats = _stages.get(record["stage"])
+        if stats is None:
+            stats = _stages[record["stage"]] = StageStats()
+        stats.add(record["seconds"], record.get("pages", 0), record.get("bytes", 0))
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            with open(SPANS_LOG, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                size = f.tell()
+            if size > SPANS_LOG_MAX_MB * 1024 * 1024:
+                # replace ذري، فلو عملية تانية بتكتب في نفس اللحظة سطرها بيروح للملف القديم أو الجديد بس
+                os.replace(SPANS_LOG, SPANS_LOG + ".1")
+        except OSError:
+            pass
+
+def prometheus_text():
+    lines = [
+        "# HELP medmate_stage_seconds Time spent in each conversion stage.",
+        "# TYPE medmate_stage_seconds histogram",
+    ]
+    totals = []
+    with _lock:
+        for stage, stats in sorted(_stages.items()):
+            label = f'stage="{stage}",pid="{os.getpid()}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, stats.buckets):
+                cumulative += count
+                lines.append(f'medmate_stage_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'medmate_stage_seconds_bucket{{{label},le="+Inf"}} {stats.count}')
+            lines.append(f"medmate_stage_seconds_sum{{{label}}} {stats.seconds:.6f}")
+            lines.append(f"medmate_stage_seconds_count{{{label}}} {stats.count}")
+            totals.append((label, stats.pages, stats.bytes))
+    lines += ["# HELP medmate_stage_pages_total Pages handled by each stage.",
+              "# TYPE medmate_stage_pages_total counter"]
+    lines += [f"medmate_stage_pages_total{{{label}}} {pages}" for label, pages, _ in totals]
+    lines += ["# HELP medmate_stage_bytes_total Bytes handled by each stage.",
+              "# TYPE medmate_stage_bytes_total counter"]
+    lines += [f"medmate_stage_bytes_total{{{label}}} {size}" for label, _, size in totals]
+    return "\n".join(lines) + "\n"
+
+def write_prometheus():
+    if not METRICS_ENABLED:
+        return
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        tmp = PROM_FILE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(prometheus_text())
+        os.replace(tmp, PROM_FILE)
+    except OSError:
+        pass
+
+@atexit.register
+def _remove_prometheus():
+    # الـ counters بتاعة عملية خلصت ما ينفعش تفضل ظاهرة كأنها شغالة
+    try:
+        os.remove(PROM_FILE)
+    except OSError:
+        pass
+
+# ---------------------------------------------------------
+# Spans
+# ---------------------------------------------------------
+class Span:
+    def __init__(self, stage, attrs):
+        self.stage = stage
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        # للحاجات اللي بتتعرف بعد ما المرحلة تبدأ (زي حجم الملف الناتج)
+        self.attrs.update(attrs)
+
+@contextmanager
+def span(stage, **attrs):
+    # attrs المعروفة: pages و bytes (بيتجمعوا في الـ metrics)، وأي حاجة تانية بتتكتب في اللوج بس
+    current = Span(stage, attrs)
+    if not METRICS_ENABLED:
+        yield current
+        return
+    parent = _parent.get()
+    token = _parent.set(stage)
+    start = time.perf_counter()
+    wall = time.time()
+    try:
+        yield current
+    except BaseException as e:
+        current.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        _parent.reset(token)
+        record = {"stage": stage, "seconds": seconds, "start": wall, "parent": parent, **current.attrs}
+        trace = _trace.get()
+        if trace is not None:
+            trace.add(record)
+        _record(record)
+
+def event(stage, **attrs):
+    # حاجة حصلت من غير وقت (زي صفحة مكررة اتشالت)، بتتعد مع باقي الـ metrics
+    if not METRICS_ENABLED:
+        return
+    record = {"stage": stage, "seconds": 0.0, "start": time.time(), "parent": _parent.get(), **attrs}
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(record)
+    _record(record)
+
+def submit(pool, fn, *args):
+    # ThreadPoolExecutor ما بينقلش الـ contextvars، فالـ spans في الـ threads
+    # كانت هتضيع من التحويل الحالي
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+# ---------------------------------------------------------
+# تجميع تحويل واحد (للعرض في الـ UI)
+# ---------------------------------------------------------
+class Trace:
+    def __init__(self):
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def add(self, record):
+        with self.lock:
+            self.spans.append(record)
+
+    def summary(self):
+        # مرحلة لكل صف بترتيب أول ظهور: العدد والوقت الكلي وأطول مرة والصفحات والحجم
+        # الوقت الكلي للمراحل اللي بتشتغل بالتوازي ممكن يبقى أكبر من الوقت الفعلي
+        rows = {}
+        with self.lock:
+            spans = sorted(self.spans, key=lambda record: record["start"])
+        for record in spans:
+            row = rows.setdefault(record["stage"], {"stage": record["stage"], "count": 0, "seconds": 0.0,
+                                                    "max_seconds": 0.0, "pages": 0, "bytes": 0})
+            row["count"] += 1
+            row["seconds"] += record["seconds"]
+            row["max_seconds"] = max(row["max_seconds"], record["seconds"])
+            row["pages"] += record.get("pages", 0)
+            row["bytes"] += record.get("bytes", 0)
+        return list(rows.values())
+
+@contextmanager
+def collect():
+    trace = Trace()
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+        write_prometheus()
@@ -0,0 +1,249 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from PIL import Image
+from azkar import zikr_update
+from common import env_int
+from pdf_pages import RASTER_DPI, rasterizer_available, pdf_page_count, iter_pdf_pages, pdf_text_pages
+from transcription_cache import cache_key
+from ocr_preprocess import preprocess_for_ocr
+from tesseract_backend import ocr_images, resolve_backend
+from metrics import span, submit as submit_traced
+from dedup import PageDeduper, dedupe_items
+
+# كل عملية tesseract بتفتح threads بتاعتها (OpenMP)، ولما نشغل كذا صفحة
+# بالتوازي لازم كل عملية تاخد نواة واحدة بس وإلا الأنوية هتتزاحم
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+CPU_COUNT = os.cpu_count() or 1
+
+# حد أقصى على مستوى السيرفر كله: مهما كان عدد الطلبة اللي شغالين في نفس الوقت
+# مش هيشتغل أكتر من عملية tesseract واحدة لكل نواة
+CPU_SLOTS = threading.BoundedSemaphore(CPU_COUNT)
+
+# ---------------------------------------------------------
+# إعدادات التوازي
+# ---------------------------------------------------------
+def default_ocr_workers():
+    # بيتقري وقت الاستخدام لأن jobs و batch.py بيحطوه قبل ما الشغل يبدأ
+    return env_int("MEDMATE_OCR_WORKERS", CPU_COUNT)
+
+def resolve_workers(max_workers, jobs):
+    workers = max_workers if max_workers and max_workers > 0 else default_ocr_workers()
+    return max(1, min(workers, CPU_COUNT, jobs))
+
+# أقصى عدد صفحات بيتبعت لعملية tesseract واحدة في الـ batch backend
+OCR_BATCH_PAGES = env_int("MEDMATE_OCR_BATCH_PAGES", 4)
+
+def resolve_batch_size(workers, total):
+    # الـ batch بيوفر تحميل ara+eng، بس ما ينفعش يقلل التوازي
+    # (4 صور على 4 أنوية لازم تروح 4 عمليات مش عملية واحدة)
+    if resolve_backend() != "batch" or not total:
+        return 1
+    return max(1, min(OCR_BATCH_PAGES, -(-total // workers)))
+
+# ---------------------------------------------------------
+# OCR
+# ---------------------------------------------------------
+def ocr_batch(images, preprocess=False, confidence=False):
+    with span("ocr.wait_cpu", pages=len(images)):
+        CPU_SLOTS.acquire()
+    try:
+        if preprocess:
+            with span("ocr.preprocess", pages=len(images)):
+                images = [preprocess_for_ocr(image) for image in images]
+        with span("ocr.tesseract", pages=len(images), backend=resolve_backend()):
+            return ocr_images(images, confidence=confidence)
+    finally:
+        CPU_SLOTS.release()
+
+def ocr_image(image, preprocess=False):
+    return ocr_batch([image], preprocess)[0]
+
+def ocr_stream(items, status_box=None, max_workers=None, total=None, preprocess=False,
+               on_group_done=None, confidence=False):
+    # items: (group, نص جاهز) أو (group, عنوان، صورة محتاجة OCR)، وممكن تكون generator
+    # الصفحات بتدخل الـ pool أول ما تجهز، وعدد الصفحات المعلقة محدود
+    # عشان الرسم ما يسبقش الـ OCR ويملا الذاكرة
+    # بيرجع dict: group -> النص بتاعه، بنفس ترتيب ظهور الـ groups
+    # on_group_done(group) بيتنادى أول ما كل صفحات الـ group تخلص
+    # confidence=True: بيرجع (النصوص، أقل ثقة في كل group) والـ group اللي ما اتعملوش OCR مش فيه ثقة
+    workers = resolve_workers(max_workers, total or CPU_COUNT)
+    batch_size = resolve_batch_size(workers, total)
+    max_in_flight = workers * 2
+    parts = []
+    pending = {}
+    batch = []
+    done_count = 0
+    remaining = {}
+    closed = []
+    confidences = {}
+
+    def finish(group):
+        if on_group_done is not None and group in closed and not remaining.get(group):
+            remaining.pop(group, None)
+            closed.remove(group)
+            on_group_done(group)
+
+    def collect(futures):
+        nonlocal done_count
+        for future in futures:
+            slots = pending.pop(future)
+            for idx, text in zip(slots, future.result()):
+                group = parts[idx][0]
+                if confidence:
+                    text, conf = text
+                    previous = confidences.get(group, conf)
+                    confidences[group] = None if conf is None or previous is None else min(conf, previous)
+                parts[idx] = (group, text)
+                remaining[group] -= 1
+                finish(group)
+            done_count += len(slots)
+            if status_box is not None:
+                suffix = f" من {total}" if total else ""
+                zikr_update(status_box, f"📄 OCR صفحة {done_count}{suffix}")
+
+    def submit():
+        slots = [idx for idx, _ in batch]
+        pending[submit_traced(pool, ocr_batch, [image for _, image in batch], preprocess, confidence)] = slots
+        batch.clear()
+        if len(pending) >= max_in_flight:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    def close(group):
+        # الـ items مترتبة بالـ group، فأول ما group جديد يبدأ اللي قبله اكتمل
+        if group is not None and group not in closed:
+            closed.append(group)
+            finish(group)
+
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        current = None
+        for item in items:
+            if item[0] != current:
+                close(current)
+                current = item[0]
+            if len(item) == 2:
+                parts.append(item)
+                continue
+            group, header, image = item
+            parts.append((group, header))
+            parts.append((group, None))
+            remaining[group] = remaining.get(group, 0) + 1
+            batch.append((len(parts) - 1, image))
+            if len(batch) >= batch_size:
+                submit()
+        if batch:
+            submit()
+        close(current)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    texts = {}
+    for group, text in parts:
+        texts[group] = texts.get(group, "") + text
+    if confidence:
+        return texts, confidences
+    return texts
+
+def count_ocr_pages(files):
+    # الصفحات اللي هتتعمل OCR فعلًا (صفحات الـ PDF اللي فيها نص مش داخلة)
+    total = 0
+    for f in files:
+        if f.type == "application/pdf":
+            if rasterizer_available():
+                text_pages = pdf_text_pages(f.getvalue())
+                if text_pages is None:
+                    total += pdf_page_count(f.getvalue())
+                else:
+                    total += sum(1 for text in text_pages if text is None)
+        else:
+            total += 1
+    return total
+
+def iter_pdf_page_items(f, dpi=None):
+    # (رقم الصفحة، العنوان، النص، الصورة) بترتيب الصفحات:
+    # الصفحة اللي فيها نص بترجع بنصها من غير رسم، والباقي بيترسم (الصورة None لو مفيش pdf2image)
+    data = f.getvalue()
+    text_pages = pdf_text_pages(data)
+    if text_pages is None:
+        if rasterizer_available():
+            for page_no, page in iter_pdf_pages(data, dpi=dpi):
+                yield page_no, f"\n\n--- صفحة {page_no} من {f.name} ---\n", None, page
+        return
+
+    scans = [page_no for page_no, text in enumerate(text_pages, 1) if text is None]
+    rendered = iter_pdf_pages(data, dpi=dpi, pages=scans) if rasterizer_available() else None
+    for page_no, text in enumerate(text_pages, 1):
+        header = f"\n\n--- صفحة {page_no} من {f.name} ---\n"
+        if text is not None:
+            yield page_no, header, text + "\n", None
+        elif rendered is not None:
+            yield page_no, header, None, next(rendered)[1]
+        else:
+            yield page_no, header, None, None
+
+def iter_ocr_items(files, status_box, dpi=None):
+    for idx, f in enumerate(files):
+        zikr_update(status_box, "📄 جاري استخراج النص (OCR)")
+
+        if f.type == "application/pdf":
+            if not rasterizer_available() and pdf_text_pages(f.getvalue()) is None:
+                yield (idx, "\n⚠️ pdf2image غير مثبت لمعالجة PDF.\n")
+                continue
+            for page_no, header, text, page in iter_pdf_page_items(f, dpi):
+                if page is not None:
+                    yield (idx, header, page)
+                else:
+                    yield (idx, header + (text or "⚠️ pdf2image غير مثبت لمعالجة الصفحة دي.\n"))
+        else:
+            yield (idx, f"\n\n--- محتوى الصورة: {f.name} ---\n", Image.open(f))
+
+def ocr_cache_key(f, dpi=None, preprocess=False):
+    # اسم الملف داخل في المفتاح لأنه مكتوب في عناوين الصفحات
+    variant = "pre" if preprocess else "raw"
+    return cache_key(f.getvalue(), f"ocr:{dpi or RASTER_DPI}:{variant}:{f.name}")
+
+def process_with_standard_ocr(files, status_box, max_workers=None, dpi=None, cache=None,
+                              preprocess=False, on_file=None):
+    # الملفات اللي اتعملها OCR قبل كده بترجع من الكاش علطول
+    # بيرجع (النص، عدد الملفات اللي رجعت من الكاش) زي process_with_ai و process_hybrid
+    # on_file(name) بيتنادى لما كل ملف يخلص (للمتابعة من برة زي الـ jobs)
+    cached = {}
+    if cache is not None:
+        for idx, f in enumerate(files):
+            text = cache.get(ocr_cache_key(f, dpi, preprocess), kind="ocr")
+            if text is not None:
+                cached[idx] = text
+                if on_file is not None:
+                    on_file(f.name)
+    todo = [f for idx, f in enumerate(files) if idx not in cached]
+
+    on_group_done = None
+    if on_file is not None:
+        on_group_done = lambda group: on_file(todo[group].name)
+
+    # الصفحات المكررة (في نفس الملف أو بين الملفات) ما بتتعملهاش OCR تاني
+    total = count_ocr_pages(todo)
+    deduped = set()
+    items = dedupe_items(iter_ocr_items(todo, status_box, dpi), PageDeduper(), deduped)
+    texts = ocr_stream(items, status_box, max_workers, total, preprocess, on_group_done)
+
+    result_text = ""
+    todo_idx = 0
+    for idx, f in enumerate(files):
+        if idx in cached:
+            result_text += cached[idx]
+            continue
+        text = texts.get(todo_idx, "")
+        # الملف اللي فيه صفحة مكررة نصه بيشاور على صفحة تانية فما بيتخزنش لوحده
+        cacheable = todo_idx not in deduped and (f.type != "application/pdf" or rasterizer_available())
+        todo_idx += 1
+        if cache is not None and cacheable:
+            cache.put(ocr_cache_key(f, dpi, preprocess), text)
+        result_text += text
+    return result_text, len(cached)
@@ -0,0 +1,177 @@
+import argparse
+import difflib
+import json
+import math
+import os
+import time
+import numpy as np
+from PIL import Image
+from common import env_int
+
+# الـ DPI اللي Tesseract بيشتغل عليها أحسن حاجة
+TARGET_DPI = env_int("MEDMATE_OCR_TARGET_DPI", 300)
+# لو الصورة مش فيها DPI (صور الموبايل) بنفترض إنها صفحة A4 طولها 11.7 بوصة
+PAGE_LONG_SIDE_INCHES = 11.7
+
+SAUVOLA_K = 0.2
+SAUVOLA_R = 128.0
+MAX_SKEW_DEGREES = 5.0
+SKEW_STEP_DEGREES = 0.25
+
+# ---------------------------------------------------------
+# خطوات التحسين
+# ---------------------------------------------------------
+def downscale(image, target_dpi=TARGET_DPI):
+    dpi = image.info.get("dpi")
+    if dpi and dpi[0]:
+        source_dpi = float(dpi[0])
+    else:
+        source_dpi = max(image.size) / PAGE_LONG_SIDE_INCHES
+    if source_dpi <= target_dpi * 1.1:
+        return image
+    scale = target_dpi / source_dpi
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.LANCZOS)
+
+def _box_mean(a, r):
+    # متوسط نافذة (2r+1)x(2r+1) حوالين كل بكسل باستخدام integral image
+    k = 2 * r + 1
+    p = np.pad(a, ((r + 1, r), (r + 1, r)), mode="edge")
+    c = p.cumsum(0).cumsum(1)
+    s = c[k:, k:] - c[:-k, k:] - c[k:, :-k] + c[:-k, :-k]
+    return s / (k * k)
+
+def binarize(gray, window=None):
+    # Sauvola: العتبة بتتغير حسب الإضاءة حوالين كل بكسل، فالظل والإضاءة
+    # المش متساوية في صور الموبايل ما يبوظوش النص
+    g = gray.astype(np.float64)
+    r = window or max(7, min(g.shape) // 60)
+    mean = _box_mean(g, r)
+    sq_mean = _box_mean(g * g, r)
+    std = np.sqrt(np.maximum(sq_mean - mean * mean, 0))
+    threshold = mean * (1 + SAUVOLA_K * (std / SAUVOLA_R - 1))
+    return np.where(g > threshold, 255, 0).astype(np.uint8)
+
+def estimate_skew(binary):
+    # بنجرب زوايا صغيرة ونختار اللي بتخلي السطور أوضح في الـ projection
+    ink = binary == 0
+    step = max(1, max(ink.shape) // 1000)
+    ys, xs = np.nonzero(ink[::step, ::step])
+    if len(ys) < 50:
+        return 0.0
+
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-MAX_SKEW_DEGREES, MAX_SKEW_DEGREES + 1e-9, SKEW_STEP_DEGREES):
+        rows = np.round(ys - xs * math.tan(math.radians(angle))).astype(np.int64)
+        hist = np.bincount(rows - rows.min()).astype(np.float64)
+        score = float((hist * hist).sum())
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+def deskew(binary):
+    angle = estimate_skew(binary)
+    if abs(angle) < SKEW_STEP_DEGREES:
+        return binary
+    rotated = Image.fromarray(binary).rotate(angle, resample=Image.NEAREST, expand=True, fillcolor=255)
+    return np.asarray(rotated)
+
+def crop_borders(binary, margin=20):
+    # بنشيل الحواف السودا (خلفية الترابيزة حوالين الورقة) وبعدين نقص على النص
+    ink = binary == 0
+    h, w = ink.shape
+    row_fill = ink.mean(axis=1)
+    col_fill = ink.mean(axis=0)
+
+    top, bottom, left, right = 0, h, 0, w
+    while top < bottom and row_fill[top] > 0.5:
+        top += 1
+    while bottom > top and row_fill[bottom - 1] > 0.5:
+        bottom -= 1
+    while left < right and col_fill[left] > 0.5:
+        left += 1
+    while right > left and col_fill[right - 1] > 0.5:
+        right -= 1
+
+    inner = ink[top:bottom, left:right]
+    if not inner.size:
+        return binary
+    rows = np.nonzero(inner.sum(axis=1) > max(2, inner.shape[1] // 1000))[0]
+    cols = np.nonzero(inner.sum(axis=0) > max(2, inner.shape[0] // 1000))[0]
+    if not len(rows) or not len(cols):
+        return binary
+
+    y0 = max(top + rows[0] - margin, 0)
+    y1 = min(top + rows[-1] + margin + 1, h)
+    x0 = max(left + cols[0] - margin, 0)
+    x1 = min(left + cols[-1] + margin + 1, w)
+    return binary[y0:y1, x0:x1]
+
+def preprocess_for_ocr(image, target_dpi=TARGET_DPI):
+    image = downscale(image, target_dpi)
+    gray = np.asarray(image.convert("L"))
+    binary = crop_borders(deskew(binarize(gray)))
+    return Image.fromarray(binary)
+
+# ---------------------------------------------------------
+# مقارنة السرعة والدقة مع المسار القديم
+#   python ocr_preprocess.py page1.jpg page2.png --truth truth_dir --json out.json
+# لو في truth_dir ملف page1.txt بنقارن بيه، غير كده بنقيس التطابق بين المسارين
+# ---------------------------------------------------------
+def _similarity(a, b):
+    return difflib.SequenceMatcher(None, " ".join(a.split()), " ".join(b.split())).ratio()
+
+def compare_preprocessing(paths, truth_dir=None, target_dpi=TARGET_DPI):
+    from ocr_engine import ocr_image
+
+    rows = []
+    for path in paths:
+        image = Image.open(path)
+        image.load()
+
+        start = time.perf_counter()
+        raw_text = ocr_image(image)
+        raw_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pre_text = ocr_image(preprocess_for_ocr(image, target_dpi))
+        pre_time = time.perf_counter() - start
+
+        row = {"file": path, "raw_seconds": raw_time, "preprocessed_seconds": pre_time}
+        truth_path = None
+        if truth_dir:
+            truth_path = os.path.join(truth_dir, os.path.splitext(os.path.basename(path))[0] + ".txt")
+        if truth_path and os.path.exists(truth_path):
+            with open(truth_path, encoding="utf-8") as f:
+                truth = f.read()
+            row["raw_accuracy"] = _similarity(raw_text, truth)
+            row["preprocessed_accuracy"] = _similarity(pre_text, truth)
+        else:
+            row["agreement"] = _similarity(raw_text, pre_text)
+        rows.append(row)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="مقارنة OCR بالتحسين ومن غيره")
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--truth", help="فولدر فيه النص الصحيح لكل صورة (name.txt)")
+    parser.add_argument("--dpi", type=int, default=TARGET_DPI)
+    parser.add_argument("--json", help="حفظ النتايج في ملف JSON")
+    args = parser.parse_args()
+
+    rows = compare_preprocessing(args.images, args.truth, args.dpi)
+    for row in rows:
+        accuracy = (f"acc {row['raw_accuracy']:.3f} -> {row['preprocessed_accuracy']:.3f}"
+                    if "raw_accuracy" in row else f"agreement {row['agreement']:.3f}")
+        print(f"{row['file']}: {row['raw_seconds']:.2f}s -> {row['preprocessed_seconds']:.2f}s, {accuracy}")
+
+    raw_total = sum(r["raw_seconds"] for r in rows)
+    pre_total = sum(r["preprocessed_seconds"] for r in rows)
+    print(f"total: {raw_total:.2f}s -> {pre_total:.2f}s")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+from PIL import Image, ImageOps, ImageStat
+from common import env_int
+from metrics import span
+
+try:
+    from pdf2image import convert_from_path, pdfinfo_from_path
+except ImportError:
+    convert_from_path = None
+    pdfinfo_from_path = None
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:
+    PdfReader = None
+    PdfWriter = None
+
+# 200 هي الـ DPI الافتراضية بتاعة pdf2image
+RASTER_DPI = env_int("MEDMATE_RASTER_DPI", 200)
+# عدد الصفحات اللي بتترسم مع بعض في المرة الواحدة
+RASTER_WINDOW = env_int("MEDMATE_RASTER_WINDOW", 4)
+
+# الصفحة اللي فيها نص بالعدد ده من الحروف على الأقل بناخد نصها علطول من غير رسم أو OCR
+TEXT_LAYER_ENABLED = os.environ.get("MEDMATE_TEXT_LAYER", "1") != "0"
+TEXT_LAYER_MIN_CHARS = env_int("MEDMATE_TEXT_LAYER_MIN_CHARS", 40)
+
+# الصور اللي بتترفع لـ Gemini: أطول ضلع بيتصغر للحد ده (أكتر من 200 DPI لورقة A4) وبتتحفظ JPEG بالجودة دي
+UPLOAD_MAX_SIDE = env_int("MEDMATE_UPLOAD_MAX_SIDE", 2400)
+UPLOAD_JPEG_QUALITY = env_int("MEDMATE_UPLOAD_JPEG_QUALITY", 80)
+# متوسط التشبع اللوني (0-255) اللي أقل منه الصورة بتتحفظ رمادي (ورق وحبر)، وأكتر منه بتفضل ألوان (رسومات)
+UPLOAD_GRAY_MAX_SATURATION = 24
+
+def rasterizer_available():
+    return convert_from_path is not None
+
+def page_runs(page_numbers, max_pages):
+    # صفحات متتالية بتتجمع في نطاقات [(أول صفحة، آخر صفحة)] من غير ما النطاق يعدي max_pages
+    runs = []
+    for page_no in sorted(page_numbers):
+        if runs and runs[-1][1] == page_no - 1 and page_no - runs[-1][0] < max_pages:
+            runs[-1][1] = page_no
+        else:
+            runs.append([page_no, page_no])
+    return [tuple(run) for run in runs]
+
+# ---------------------------------------------------------
+# النص المكتوب جوه الـ PDF (ملفات PowerPoint و Word)
+# ---------------------------------------------------------
+_text_layers = OrderedDict()
+_text_lock = threading.Lock()
+TEXT_LAYER_CACHE_SIZE = 32
+
+def pdf_text_pages(pdf_bytes):
+    # list بنص كل صفحة، وNone للصفحة اللي هي صورة بس (سكانر أو موبايل)
+    # وبيرجع None لو مش هينفع نقرا النص خالص (pypdf مش متثبت أو الملف متشفر)
+    if PdfReader is None or not TEXT_LAYER_ENABLED:
+        return None
+    # الـ OCR والعداد والذكاء الاصطناعي بيسألوا على نفس الملف، فبنقراه مرة واحدة
+    key = hashlib.sha256(pdf_bytes).digest()
+    with _text_lock:
+        if key in _text_layers:
+            _text_layers.move_to_end(key)
+            return _text_layers[key]
+
+    with span("pdf.text_layer", bytes=len(pdf_bytes)) as layer:
+        try:
+            reader = PdfReader(io.BytesIO(pdf_bytes))
+            pages = []
+            for page in reader.pages:
+                try:
+                    text = page.extract_text() or ""
+                except Exception:
+                    text = ""
+                # NFKC بيرجع حروف العربي من أشكال العرض (presentation forms) للحروف العادية
+                text = unicodedata.normalize("NFKC", text).strip()
+                pages.append(text if len(text) >= TEXT_LAYER_MIN_CHARS else None)
+        except Exception:
+            pages = None
+        layer.set(pages=len(pages or []), text_pages=sum(1 for text in pages or [] if text))
+
+    with _text_lock:
+        _text_layers[key] = pages
+        while len(_text_layers) > TEXT_LAYER_CACHE_SIZE:
+            _text_layers.popitem(last=False)
+    return pages
+
+# ---------------------------------------------------------
+# رسم صفحات PDF على دفعات صغيرة
+# ---------------------------------------------------------
+def pdf_page_count(pdf_bytes):
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+        tmp.write(pdf_bytes)
+        tmp.flush()
+        return int(pdfinfo_from_path(tmp.name)["Pages"])
+
+def iter_pdf_pages(pdf_bytes, dpi=None, window=None, pages=None):
+    # بيرجع (رقم الصفحة، صورة) صفحة بصفحة بدل ما يرسم الملف كله مرة واحدة،
+    # فالذاكرة ثابتة مهما كان عدد الصفحات والـ OCR يبدأ من أول صفحة
+    # pages: أرقام الصفحات اللي تترسم بس (None = كل الصفحات)
+    dpi = dpi or RASTER_DPI
+    window = window or RASTER_WINDOW
+    if pages is not None and not pages:
+        return
+
+    # بنكتب الملف مرة واحدة بس، وكل دفعة بتقرا منه نطاق صفحات
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+        tmp.write(pdf_bytes)
+        tmp.flush()
+        if pages is None:
+            total = int(pdfinfo_from_path(tmp.name)["Pages"])
+            pages = range(1, total + 1)
+
+        for first, last in page_runs(pages, window):
+            with span("pdf.rasterize", pages=last - first + 1, dpi=dpi):
+                rendered = convert_from_path(tmp.name, dpi=dpi, first_page=first, last_page=last)
+            page_no = first
+            while rendered:
+                # pop عشان الصفحة تتمسح من الذاكرة أول ما الـ OCR يخلص منها
+                yield page_no, rendered.pop(0)
+                page_no += 1
+
+# ---------------------------------------------------------
+# تقسيم PDF لأجزاء
+# ---------------------------------------------------------
+def split_pdf(pdf_bytes, chunk_pages):
+    # بيرجع [(أول صفحة، آخر صفحة، bytes)]، والملف الصغير بيرجع زي ما هو
+    if PdfReader is None:
+        return [(1, None, pdf_bytes)]
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    total = len(reader.pages)
+    if total <= chunk_pages:
+        return [(1, total, pdf_bytes)]
+
+    ranges = [(first, min(first + chunk_pages - 1, total)) for first in range(1, total + 1, chunk_pages)]
+    return [(first, last, data) for (first, last), data in zip(ranges, _write_ranges(reader, ranges))]
+
+def _write_ranges(reader, ranges):
+    for first, last in ranges:
+        writer = PdfWriter()
+        for page in reader.pages[first - 1:last]:
+            writer.add_page(page)
+        out = io.BytesIO()
+        writer.write(out)
+        yield out.getvalue()
+
+def merge_pdfs(pdf_list):
+    # كذا PDF صغير في ملف واحد بنفس الترتيب (لطلب Gemini واحد بدل طلب لكل ملف)
+    if PdfWriter is None:
+        raise RuntimeError("pypdf غير مثبت لدمج ملفات PDF.")
+    writer = PdfWriter()
+    for pdf_bytes in pdf_list:
+        for page in PdfReader(io.BytesIO(pdf_bytes)).pages:
+            writer.add_page(page)
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+def pdf_page_total(pdf_bytes):
+    # عدد الصفحات من غير poppler، أو None لو pypdf مش متثبت أو الملف بايظ
+    if PdfReader is None:
+        return None
+    try:
+        return len(PdfReader(io.BytesIO(pdf_bytes)).pages)
+    except Exception:
+        return None
+
+def extract_page_ranges(pdf_bytes, ranges):
+    # ranges: [(أول صفحة، آخر صفحة)] بترقيم من 1، وبيرجع bytes لكل نطاق
+    if PdfReader is None:
+        raise RuntimeError("pypdf غير مثبت لتقسيم PDF.")
+    return list(_write_ranges(PdfReader(io.BytesIO(pdf_bytes)), ranges))
+
+# ---------------------------------------------------------
+# دمج الصور في PDF واحد: صورة واحدة بس في الذاكرة في أي وقت،
+# وكل صورة بتتصغر وتتضغط JPEG وتتكتب في الملف علطول
+# ---------------------------------------------------------
+def _looks_gray(img):
+    thumb = img.copy()
+    thumb.thumbnail((64, 64))
+    return ImageStat.Stat(thumb.convert("HSV")).mean[1] < UPLOAD_GRAY_MAX_SATURATION
+
+def _upload_jpeg(file):
+    # بيرجع (العرض، الطول، رمادي ولا لأ، bytes الـ JPEG)
+    data = file.getvalue()
+    img = Image.open(io.BytesIO(data))
+    upright = img.getexif().get(0x0112, 1) == 1
+    if (img.format == "JPEG" and upright and img.mode in ("L", "RGB")
+            and max(img.size) <= UPLOAD_MAX_SIDE and len(data) <= img.width * img.height):
+        # JPEG صغير ومضغوط كفاية: بيدخل زي ما هو من غير ما نفكه ونضغطه تاني
+        return img.width, img.height, img.mode == "L", data
+    # draft بيخلي JPEG يتفك بمقاس أصغر علطول (لحد ضعف المطلوب) بدل الـ 12 ميجا بكسل كلها
+    img.draft("RGB", (UPLOAD_MAX_SIDE, UPLOAD_MAX_SIDE))
+    if not upright:
+        img = ImageOps.exif_transpose(img)
+    if img.mode not in ("L", "RGB"):
+        img = img.convert("L" if img.mode in ("1", "LA", "I", "I;16") else "RGB")
+    # BILINEAR في التصغير بيعمل antialias وأسرع من LANCZOS بالضعف، والفرق مش باين في الكلام
+    img.thumbnail((UPLOAD_MAX_SIDE, UPLOAD_MAX_SIDE), Image.BILINEAR)
+    if img.mode == "RGB" and _looks_gray(img):
+        img = img.convert("L")
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=UPLOAD_JPEG_QUALITY)
+    return img.width, img.height, img.mode == "L", out.getvalue()
+
+def write_images_pdf(image_files, out):
+    # PDF بسيط: صفحة لكل صورة (Page + Image XObject بـ DCTDecode + Contents)
+    # الـ Pages والـ Catalog بيتكتبوا في الآخر عشان منحتاجش نعرف عدد الصفحات من الأول
+    written = 0
+    offsets = {}
+
+    def write(data):
+        nonlocal written
+        out.write(data)
+        written += len(data)
+
+    def obj(num, body, stream=None):
+        offsets[num] = written
+        write(b"%d 0 obj\n%s" % (num, body))
+        if stream is not None:
+            write(b"\nstream\n")
+            write(stream)
+            write(b"\nendstream")
+        write(b"\nendobj\n")
+
+    write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    kids = []
+    for file in image_files:
+        width, height, gray, jpeg = _upload_jpeg(file)
+        page = 3 + 3 * len(kids)
+        kids.append(b"%d 0 R" % page)
+        obj(page, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+                  b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>"
+                  % (width, height, page + 1, page + 2))
+        obj(page + 1, b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s "
+                      b"/BitsPerComponent 8 /Filter /DCTDecode /Length %d >>"
+                      % (width, height, b"/DeviceGray" if gray else b"/DeviceRGB", len(jpeg)), jpeg)
+        draw = b"q %d 0 0 %d 0 0 cm /Im0 Do Q" % (width, height)
+        obj(page + 2, b"<< /Length %d >>" % len(draw), draw)
+    obj(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids)))
+    obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    xref = written
+    size = 3 + 3 * len(kids)
+    write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+    write(b"".join(b"%010d 00000 n \n" % offsets[num] for num in range(1, size)))
+    write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref))
+    return written
+
+def convert_images_to_pdf(image_files):
+    if not image_files:
+        return None
+    with span("pdf.merge_images", pages=len(image_files)) as merge:
+        pdf_io = io.BytesIO()
+        merge.set(bytes=write_images_pdf(image_files, pdf_io))
+        pdf_io.seek(0)
+        return pdf_io
+
+def image_pdf_chunks(image_files, chunk_pages):
+    # زي split_pdf للصور: [(أول صفحة، آخر صفحة، bytes)] من غير ما الملف المدموج كله يتعمل ويتقسم تاني
+    chunks = []
+    for first in range(1, len(image_files) + 1, chunk_pages):
+        last = min(first + chunk_pages - 1, len(image_files))
+        chunks.append((first, last, convert_images_to_pdf(image_files[first - 1:last]).getvalue()))
+    return chunks
@@ -1,3 +1,7 @@
+from functools import lru_cache
+
+# النص واحد لكل (نوع الملف، خط يد)، فبيتبني مرة واحدة بس
+@lru_cache(maxsize=None)
 def get_medical_prompt(content_type, is_handwritten=False):
     # التعليمات الأساسية
     base_prompt = """
@@ -0,0 +1,57 @@
+from common import env_int
+
+# عدد الحروف التقريبي في كل صفحة من المعاينة والتعديل (القسم الواحد ما بيتقسمش حتى لو أكبر)
+PAGE_CHARS = env_int("MEDMATE_PREVIEW_PAGE_CHARS", 20000)
+TITLE_CHARS = 60
+
+# ---------------------------------------------------------
+# تقسيم النص لأقسام عند العناوين والملفات والصفحات
+# ---------------------------------------------------------
+def is_section_start(line):
+    # # عنوان (نفس اللي بيبقى Heading في الوورد)، Source: اسم الملف (AI)،
+    # أو --- صفحة 3 من ... --- (OCR والصفحات اللي اتاخد نصها من الـ PDF)
+    line = line.strip()
+    return (line.startswith('#') or line.startswith('Source:')
+            or (line.startswith('--- ') and line.endswith(' ---')))
+
+def split_sections(text):
+    # "".join(split_sections(text)) == text دايمًا، فالتعديل بيرجع نفس النص بالظبط
+    # القسم اللي لسه فيه علامات بس (زي Source: وبعدها # عنوان علطول، أول كل ملف من الـ AI)
+    # بيكمل مع اللي بعده بدل ما يبقى قسم لوحده فيه سطر واحد
+    sections = []
+    current = []
+    has_body = False
+    for line in text.splitlines(keepends=True):
+        starts = is_section_start(line)
+        if starts and has_body:
+            sections.append("".join(current))
+            current = []
+            has_body = False
+        current.append(line)
+        has_body = has_body or (not starts and bool(line.strip()))
+    if current:
+        sections.append("".join(current))
+    return sections
+
+def section_title(section):
+    for line in section.split('\n'):
+        line = line.strip()
+        if line:
+            title = line.lstrip('#').strip(' -').replace('*', '').strip()
+            return title if len(title) <= TITLE_CHARS else title[:TITLE_CHARS] + "…"
+    return ""
+
+def paginate(sections, page_chars=PAGE_CHARS):
+    # [(أول قسم، بعد آخر قسم)] لكل صفحة
+    pages = []
+    start = 0
+    size = 0
+    for idx, section in enumerate(sections):
+        if idx > start and size + len(section) > page_chars:
+            pages.append((start, idx))
+            start = idx
+            size = 0
+        size += len(section)
+    if sections:
+        pages.append((start, len(sections)))
+    return pages
@@ -0,0 +1,158 @@
+import csv
+import io
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+LANG = 'ara+eng'
+PSM = 3
+# tesseract بيكتب \f بعد كل صفحة، وpytesseract بيرجعها زي ما هي
+PAGE_SEPARATOR = '\x0c'
+
+# ---------------------------------------------------------
+# الثقة: متوسط confidence الكلمات (0-100)، وNone لو مفيش ولا كلمة
+# ---------------------------------------------------------
+def mean_confidence(words):
+    # words: [(النص، الثقة)] زي أعمدة text و conf في image_to_data
+    values = [float(conf) for text, conf in words if str(text).strip() and float(conf) >= 0]
+    return sum(values) / len(values) if values else None
+
+# auto: tesserocr لو متثبت، وإلا batch لو tesseract موجود، وإلا pytesseract
+OCR_BACKEND = os.environ.get("MEDMATE_OCR_BACKEND", "auto")
+
+def tesseract_cmd():
+    if pytesseract is not None:
+        return pytesseract.pytesseract.tesseract_cmd
+    return "tesseract"
+
+def resolve_backend(backend=None):
+    backend = backend or OCR_BACKEND
+    if backend != "auto":
+        return backend
+    if tesserocr is not None:
+        return "tesserocr"
+    if shutil.which(tesseract_cmd()):
+        return "batch"
+    return "pytesseract"
+
+# ---------------------------------------------------------
+# tesserocr: engine جاهز في الذاكرة بدل ما نحمّل ara+eng مع كل صفحة
+# ---------------------------------------------------------
+# الـ engines بتتحفظ هنا بعد ما تخلص وبتتاخد تاني في الطلب اللي بعده،
+# فعددها مش بيزيد عن أكبر عدد workers اشتغل في نفس الوقت
+_engines = queue.LifoQueue()
+
+def _acquire_engine():
+    try:
+        return _engines.get_nowait()
+    except queue.Empty:
+        return tesserocr.PyTessBaseAPI(lang=LANG, psm=tesserocr.PSM.AUTO)
+
+def _ocr_tesserocr(images, confidence=False):
+    api = _acquire_engine()
+    try:
+        results = []
+        for image in images:
+            api.SetImage(image)
+            text = api.GetUTF8Text() + PAGE_SEPARATOR
+            if confidence:
+                words = api.MapWordConfidences()
+                results.append((text, mean_confidence(words)))
+            else:
+                results.append(text)
+        return results
+    finally:
+        api.Clear()
+        _engines.put(api)
+
+# ---------------------------------------------------------
+# batch: كل الصفحات في TIFF واحد في الذاكرة وعملية tesseract واحدة
+# ---------------------------------------------------------
+def _multipage_tiff(images):
+    frames = [img if img.mode in ('1', 'L', 'RGB') else img.convert('RGB') for img in images]
+    buffer = io.BytesIO()
+    frames[0].save(buffer, format='TIFF', save_all=True, append_images=frames[1:],
+                   compression='tiff_lzw')
+    return buffer.getvalue()
+
+def _run_tesseract(images, output, configs=()):
+    proc = subprocess.run(
+        [tesseract_cmd(), 'stdin', output, '-l', LANG, '--psm', str(PSM), *configs],
+        input=_multipage_tiff(images), capture_output=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"فشل tesseract: {proc.stderr.decode('utf-8', 'ignore').strip()}")
+    return proc.stdout
+
+def _split_pages(text, count):
+    pages = text.split(PAGE_SEPARATOR)
+    if len(pages) < count:
+        raise RuntimeError("عدد الصفحات اللي رجعت من tesseract أقل من المتوقع.")
+    return [page + PAGE_SEPARATOR for page in pages[:count]]
+
+def _tsv_confidences(tsv, count):
+    words = [[] for _ in range(count)]
+    for row in csv.DictReader(io.StringIO(tsv), delimiter='\t', quoting=csv.QUOTE_NONE):
+        page = int(row['page_num']) - 1
+        if row['level'] == '5' and 0 <= page < count:
+            words[page].append((row['text'] or '', row['conf']))
+    return [mean_confidence(page_words) for page_words in words]
+
+def _ocr_batch(images, confidence=False):
+    if not confidence:
+        return _split_pages(_run_tesseract(images, 'stdout').decode('utf-8'), len(images))
+    # txt و tsv من نفس العملية: النص زي ما هو والثقة لكل صفحة من الـ tsv
+    with tempfile.TemporaryDirectory() as tmp:
+        base = os.path.join(tmp, 'out')
+        _run_tesseract(images, base, ('txt', 'tsv'))
+        with open(base + '.txt', encoding='utf-8') as f:
+            texts = _split_pages(f.read(), len(images))
+        with open(base + '.tsv', encoding='utf-8') as f:
+            confidences = _tsv_confidences(f.read(), len(images))
+    return list(zip(texts, confidences))
+
+# ---------------------------------------------------------
+# pytesseract: عملية وملف مؤقت لكل صفحة (المسار القديم)
+# ---------------------------------------------------------
+def _ocr_pytesseract(images, confidence=False):
+    if pytesseract is None:
+        raise RuntimeError("pytesseract غير مثبت.")
+    results = []
+    for image in images:
+        if not confidence:
+            results.append(pytesseract.image_to_string(image, lang=LANG, config=f'--psm {PSM}'))
+            continue
+        # txt و tsv من نفس العملية (زي batch) بدل image_to_string وبعدها image_to_data
+        tess = pytesseract.pytesseract
+        with tess.save(image) as (base, input_filename):
+            tess.run_tesseract(input_filename, base, 'txt', LANG, config=f'--psm {PSM} -c tessedit_create_tsv=1')
+            with open(base + '.txt', encoding='utf-8') as f:
+                text = f.read()
+            with open(base + '.tsv', encoding='utf-8') as f:
+                results.append((text, _tsv_confidences(f.read(), 1)[0]))
+    return results
+
+BACKENDS = {
+    "tesserocr": _ocr_tesserocr,
+    "batch": _ocr_batch,
+    "pytesseract": _ocr_pytesseract,
+}
+
+def ocr_images(images, backend=None, confidence=False):
+    # نفس ناتج pytesseract.image_to_string لكل صورة وبنفس الترتيب
+    # confidence=True: (النص، متوسط ثقة الكلمات) لكل صورة
+    if not images:
+        return []
+    return BACKENDS[resolve_backend(backend)](images, confidence)
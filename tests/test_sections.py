@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sections import split_sections, paginate
+
+def test_source_line_stays_with_its_heading():
+    # أول كل ملف من الـ AI: Source: وبعدها # عنوان علطول
+    text = "".join(f"\n\nSource: lec{i}.pdf\n# Lecture {i}\n" + "line of text\n" * 5 for i in range(5))
+    sections = split_sections(text)
+    assert "".join(sections) == text
+    assert len(sections) == 5
+    for i, section in enumerate(sections):
+        assert f"Source: lec{i}.pdf" in section
+        assert f"# Lecture {i}" in section
+
+def test_paginate_never_leaves_a_marker_alone():
+    text = "".join(f"Source: lec{i}.pdf\n# Lecture {i}\n" + "x" * 300 + "\n" for i in range(5))
+    sections = split_sections(text)
+    pages = paginate(sections, page_chars=700)
+    assert len(pages) == 3
+    for first, last in pages:
+        assert sections[last - 1].rstrip().splitlines()[-1].startswith("x")
+
+def test_headings_and_page_markers_still_split():
+    text = "# A\nbody a\n## B\nbody b\n\n--- صفحة 2 ---\nbody c\n"
+    assert split_sections(text) == ["# A\nbody a\n", "## B\nbody b\n\n", "--- صفحة 2 ---\nbody c\n"]
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from common import env_int
+
+CACHE_DIR = os.environ.get("MEDMATE_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "medmate_cache")
+CACHE_MAX_BYTES = env_int("MEDMATE_CACHE_MAX_MB", 512) * 1024 * 1024
+CACHE_MAX_AGE = env_int("MEDMATE_CACHE_MAX_DAYS", 30) * 24 * 3600
+# put بيعد الحجم بنفسه وما بيلفش على الكاش كله غير لما الحجم يعدّي الحد أو كل المدة دي
+# (عشان الملفات القديمة واللي عمليات تانية كتبتها)
+EVICT_INTERVAL = 3600
+# لما الحجم يعدّي الحد بنمسح لحد النسبة دي منه، فاللفة اللي بعدها ما بتجيش مع الـ put اللي بعده علطول
+EVICT_TARGET = 0.9
+
+# الـ workers وعمليات batch.py بيزودوا نفس العدادات، فهي في SQLite بدل ملف JSON بيتكتب من الأول كل مرة
+STATS_DB = "stats.sqlite3"
+# ملف العدادات القديم، بيتنقل للداتابيز أول مرة وبيتمسح
+STATS_FILE = "stats.json"
+STATS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    kind TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, field)
+);
+"""
+
+# ---------------------------------------------------------
+# مفتاح الكاش
+# ---------------------------------------------------------
+def cache_key(data, mode, prompt="", is_handwritten=False):
+    # data ممكن تكون bytes أو list of bytes (زي الصور اللي بتتدمج في PDF واحد)
+    h = hashlib.sha256()
+    for part in (mode, prompt, "1" if is_handwritten else "0"):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    chunks = [data] if isinstance(data, (bytes, bytearray)) else data
+    for chunk in chunks:
+        h.update(hashlib.sha256(chunk).digest())
+    return h.hexdigest()
+
+# ---------------------------------------------------------
+# كاش على الديسك بـ LRU حسب الحجم والعمر
+# ---------------------------------------------------------
+class TranscriptionCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, max_age=CACHE_MAX_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._stats_ready = False
+        # الحجم الكلي من آخر لفة على الكاش + اللي put كتبه بعدها (None = لسه ما اتحسبش)
+        self._size = None
+        self._scanned = 0.0
+        self._size_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".md")
+
+    def get(self, key, kind="ai"):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+            # الـ mtime هو وقت آخر استخدام، وعليه بيتعمل الـ LRU
+            os.utime(path)
+        except OSError:
+            self._bump(kind, "misses")
+            return None
+        self._bump(kind, "hits")
+        return text
+
+    def put(self, key, text):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            old_size = os.path.getsize(path)
+        except OSError:
+            old_size = 0
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            new_size = f.tell()
+        os.replace(tmp, path)
+        with self._size_lock:
+            if self._size is not None:
+                self._size += new_size - old_size
+            due = (self._size is None or self._size > self.max_bytes
+                   or time.time() - self._scanned > EVICT_INTERVAL)
+        if due:
+            self.evict()
+
+    def _entries(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(".md"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    info = os.stat(path)
+                except OSError:
+                    continue
+                yield path, info.st_size, info.st_mtime
+
+    def evict(self):
+        now = time.time()
+        entries = []
+        total = 0
+        for path, size, mtime in self._entries():
+            if now - mtime > self.max_age:
+                self._remove(path)
+                continue
+            entries.append((mtime, size, path))
+            total += size
+
+        entries.sort()
+        limit = self.max_bytes * EVICT_TARGET if total > self.max_bytes else self.max_bytes
+        for mtime, size, path in entries:
+            if total <= limit:
+                break
+            self._remove(path)
+            total -= size
+        with self._size_lock:
+            self._size = total
+            self._scanned = now
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    # ---- عدادات hit/miss (متخزنة على الديسك عشان تعيش بعد الـ restart) ----
+    def _stats_conn(self):
+        conn = sqlite3.connect(os.path.join(self.directory, STATS_DB), timeout=30, isolation_level=None)
+        if not self._stats_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(STATS_SCHEMA)
+            self._import_legacy_stats(conn)
+            self._stats_ready = True
+        return conn
+
+    def _import_legacy_stats(self, conn):
+        # BEGIN IMMEDIATE: لو أكتر من عملية فتحت الداتابيز مع بعض، واحدة بس اللي بتنقل الملف القديم
+        path = os.path.join(self.directory, STATS_FILE)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            with open(path, encoding="utf-8") as f:
+                legacy = json.load(f)
+            for kind, counters in legacy.items():
+                for field, value in counters.items():
+                    conn.execute("INSERT INTO counters VALUES (?, ?, ?) ON CONFLICT (kind, field) "
+                                 "DO UPDATE SET value = value + excluded.value", (kind, field, int(value)))
+            os.remove(path)
+        except (OSError, ValueError, TypeError, AttributeError):
+            pass
+        finally:
+            conn.execute("COMMIT")
+
+    def _read_stats(self):
+        stats = {}
+        try:
+            conn = self._stats_conn()
+            try:
+                for kind, field, value in conn.execute("SELECT kind, field, value FROM counters"):
+                    stats.setdefault(kind, {"hits": 0, "misses": 0})[field] = value
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            pass
+        return stats
+
+    def _bump(self, kind, field):
+        # زيادة واحدة جوه SQLite نفسها، فالعمليات اللي شغالة مع بعض ما بتمسحش عدادات بعض
+        try:
+            conn = self._stats_conn()
+            try:
+                conn.execute("INSERT INTO counters VALUES (?, ?, 1) ON CONFLICT (kind, field) "
+                             "DO UPDATE SET value = value + 1", (kind, field))
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            pass
+
+    def stats(self):
+        stats = self._read_stats()
+        entries = list(self._entries())
+        stats["entries"] = len(entries)
+        stats["bytes"] = sum(size for _, size, _ in entries)
+        return stats
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+def get_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = TranscriptionCache()
+        return _default_cache
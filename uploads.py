@@ -0,0 +1,11 @@
+import io
+
+# ---------------------------------------------------------
+# ملف متخزن بنفس شكل UploadedFile بتاع Streamlit (name, type, getvalue)
+# (هنا لوحده ومن غير أي import من المشروع عشان أي module يقدر يستخدمه)
+# ---------------------------------------------------------
+class UploadedBlob(io.BytesIO):
+    def __init__(self, name, type, data):
+        super().__init__(data)
+        self.name = name
+        self.type = type
@@ -0,0 +1,170 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from docx import Document
+from docx.shared import Pt, RGBColor
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml.ns import qn
+from docx.oxml import OxmlElement
+from docx_xml import build_styled_docx
+from metrics import span
+
+# "xml" بيكتب document.xml مباشرة (الأسرع)، و"python-docx" هو المسار القديم
+# اللي بنقارن بيه الشكل
+WORD_ENGINE = os.environ.get("MEDMATE_WORD_ENGINE", "xml")
+
+# آخر كام ملف اتعمل، بالـ hash بتاع النص والعنوان (Streamlit بيعيد السكريبت مع كل ضغطة)
+DOC_CACHE_SIZE = 8
+
+# ---------------------------------------------------------
+# Word Formatting
+# ---------------------------------------------------------
+def add_markdown_paragraph(parent, text, style='Normal', align=None):
+    if hasattr(parent, 'add_paragraph'):
+        p = parent.add_paragraph(style=style)
+    else:
+        p = parent
+
+    text = text.replace('***', '**')  # نسيب bold فقط
+    if align:
+        p.alignment = align
+    else:
+        p.alignment = WD_ALIGN_PARAGRAPH.RIGHT if any("\u0600" <= c <= "\u06FF" for c in text) else WD_ALIGN_PARAGRAPH.LEFT
+
+    parts = text.split('**')
+    for i, part in enumerate(parts):
+        if not part:
+            continue
+        run = p.add_run(part)
+        run.font.name = 'Times New Roman'
+        run.font.size = Pt(12)
+        run.font.bold = True if i % 2 == 1 else False
+    return p
+
+def add_page_border(doc):
+    sec_pr = doc.sections[0]._sectPr
+    pg_borders = OxmlElement('w:pgBorders')
+    pg_borders.set(qn('w:offsetFrom'), 'page')
+    for border_name in ('top', 'left', 'bottom', 'right'):
+        border = OxmlElement(f'w:{border_name}')
+        border.set(qn('w:val'), 'single')
+        border.set(qn('w:sz'), '12')
+        border.set(qn('w:space'), '24')
+        border.set(qn('w:color'), 'auto')
+        pg_borders.append(border)
+    sec_pr.append(pg_borders)
+
+def create_word_table(doc, table_lines):
+    if not table_lines:
+        return
+    cleaned_rows = []
+    for line in table_lines:
+        if '---' in line:
+            continue
+        cells = [c.strip() for c in line.strip('|').split('|')]
+        cleaned_rows.append(cells)
+
+    if not cleaned_rows:
+        return
+
+    table = doc.add_table(rows=len(cleaned_rows), cols=len(cleaned_rows[0]))
+    table.style = 'Table Grid'
+
+    for r_idx, row_data in enumerate(cleaned_rows):
+        row = table.rows[r_idx]
+        for c_idx, cell_text in enumerate(row_data):
+            if c_idx < len(row.cells):
+                cell = row.cells[c_idx]
+                cell.text = ""
+                p = cell.paragraphs[0]
+                add_markdown_paragraph(p, cell_text,
+                                       align=WD_ALIGN_PARAGRAPH.CENTER if r_idx == 0 else None)
+                if r_idx == 0:
+                    for run in p.runs:
+                        run.font.bold = True
+    doc.add_paragraph("")
+
+def create_styled_word_doc_reference(text_content, user_title):
+    doc = Document()
+    add_page_border(doc)
+
+    style = doc.styles['Normal']
+    font = style.font
+    font.name = 'Times New Roman'
+    font.size = Pt(12)
+
+    clean_title = user_title.replace('*', '').replace('#', '').strip()
+    main_heading = doc.add_heading(clean_title, 0)
+    main_heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    for run in main_heading.runs:
+        run.font.name = 'Times New Roman'
+        run.font.size = Pt(16)
+        run.font.bold = True
+        run.font.color.rgb = RGBColor(0, 0, 0)
+
+    lines = text_content.split('\n')
+    table_buffer = []
+
+    for line in lines:
+        line = line.strip()
+        if line.startswith('|') and line.endswith('|'):
+            table_buffer.append(line)
+            continue
+        else:
+            if table_buffer:
+                create_word_table(doc, table_buffer)
+                table_buffer = []
+
+        if not line:
+            continue
+
+        if line.startswith('#'):
+            clean_text = line.lstrip('#').replace('*', '').strip()
+            h = doc.add_heading(clean_text, level=1)
+            h.alignment = WD_ALIGN_PARAGRAPH.RIGHT if any("\u0600" <= c <= "\u06FF" for c in line) else WD_ALIGN_PARAGRAPH.LEFT
+            for run in h.runs:
+                run.font.name = 'Times New Roman'
+                run.font.size = Pt(14)
+                run.font.bold = True
+                run.font.color.rgb = RGBColor(0, 0, 0)
+
+        elif line.startswith('* ') or line.startswith('- '):
+            clean_text = line.lstrip('* ').lstrip('- ').strip()
+            add_markdown_paragraph(doc, clean_text, style='List Bullet')
+
+        else:
+            add_markdown_paragraph(doc, line)
+
+    if table_buffer:
+        create_word_table(doc, table_buffer)
+
+    bio = io.BytesIO()
+    doc.save(bio)
+    bio.seek(0)
+    return bio
+
+_doc_cache = OrderedDict()
+_doc_lock = threading.Lock()
+
+def create_styled_word_doc(text_content, user_title, engine=None):
+    engine = engine or WORD_ENGINE
+    key = (engine, user_title, hashlib.sha256(text_content.encode('utf-8')).hexdigest())
+    with _doc_lock:
+        data = _doc_cache.get(key)
+        if data is not None:
+            _doc_cache.move_to_end(key)
+            return io.BytesIO(data)
+
+    with span("docx.build", bytes=len(text_content.encode('utf-8')), engine=engine):
+        if engine == "python-docx":
+            data = create_styled_word_doc_reference(text_content, user_title).getvalue()
+        else:
+            data = build_styled_docx(text_content, user_title).getvalue()
+
+    with _doc_lock:
+        _doc_cache[key] = data
+        while len(_doc_cache) > DOC_CACHE_SIZE:
+            _doc_cache.popitem(last=False)
+    return io.BytesIO(data)